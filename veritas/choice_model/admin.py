@@ -1,5 +1,10 @@
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 from .models import *
+from .profiling import get_profile_path
 
 
 admin.site.register(BaselineModel)
@@ -7,3 +12,44 @@ admin.site.register(BaselineSite)
 admin.site.register(Site)
 admin.site.register(ModifiedSite)
 admin.site.register(ModifiedSitesBundle)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created', 'method', 'path', 'status_code', 'duration', 'user']
+    list_filter = ['method', 'status_code']
+    search_fields = ['path']
+    fields = ['created', 'user', 'method', 'path', 'status_code', 'duration', 'profile_file', 'profile_summary']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<uuid:pk>/download/', self.admin_site.admin_view(self.download), name='choice_model_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download(self, request, pk):
+        """
+        return the full profile, to open with pstats or tools such as snakeviz
+        """
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        try:
+            file = open(get_profile_path(profile.file_name), 'rb')
+        except FileNotFoundError:
+            # e.g. CHOICE_MODEL_PROFILE_DIR was cleared, or is not shared between servers
+            raise Http404('The file of this profile no longer exists.')
+
+        return FileResponse(file, as_attachment=True, filename=profile.file_name)
+
+    @admin.display(description='Profile')
+    def profile_file(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse('admin:choice_model_requestprofile_download', args=[obj.pk]), obj.file_name)
+
+    @admin.display(description='Summary')
+    def profile_summary(self, obj):
+        return format_html('<pre>{}</pre>', obj.summary)
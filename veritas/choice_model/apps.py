@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ChoiceModelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'choice_model'
+
+    def ready(self):
+        from choice_model import signals
@@ -0,0 +1,132 @@
+import math
+
+import pandas as pd
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from choice_model import constants
+from choice_model.cache import invalidate_baseline_summary
+from choice_model.models import BaselineModel, BaselineSite
+
+
+# suffix of the calibration form fields, which are named after their site
+FORM_FIELD_SUFFIX = ' (site)'
+
+# columns of an uploaded visitation dataset
+NAME_COLUMN = 'name'
+VISITS_COLUMN = 'visits'
+
+# invalid values listed in a validation error, the rest are counted
+MAX_LISTED_ERRORS = 5
+
+
+def get_form_visits(post):
+    """
+    return dictionary of site names and visits (as entered) from the fields of the calibration form
+    """
+    return {key[:-len(FORM_FIELD_SUFFIX)]: value for key, value in post.items() if key.endswith(FORM_FIELD_SUFFIX)}
+
+
+def read_visits_file(uploaded_file):
+    """
+    return dictionary of site names and visits (as read) from an uploaded CSV or Parquet file with name and visits columns
+    """
+    file_name = uploaded_file.name.lower()
+    try:
+        if file_name.endswith('.csv'):
+            visits = pd.read_csv(uploaded_file, dtype={NAME_COLUMN: str})
+        elif file_name.endswith('.parquet'):
+            visits = pd.read_parquet(uploaded_file)
+        else:
+            raise ValidationError('Visits have to be uploaded as a .csv or .parquet file.')
+    except (ValueError, OSError, UnicodeDecodeError) as error:
+        raise ValidationError(f'{uploaded_file.name} could not be read: {error}')
+
+    # dataframes of visits saved as parquet (such as BASELINE_VISITS) keep site names as their index
+    if NAME_COLUMN not in visits.columns and not isinstance(visits.index, pd.RangeIndex):
+        visits = visits.rename_axis(NAME_COLUMN).reset_index()
+
+    missing_columns = [column for column in [NAME_COLUMN, VISITS_COLUMN] if column not in visits.columns]
+    if missing_columns:
+        raise ValidationError(f'{uploaded_file.name} is missing the {" and ".join(missing_columns)} column.')
+
+    duplicated = visits[NAME_COLUMN][visits[NAME_COLUMN].duplicated()].unique()
+    if len(duplicated):
+        raise ValidationError(_list_errors('Sites are listed more than once', duplicated))
+
+    return dict(zip(visits[NAME_COLUMN], visits[VISITS_COLUMN]))
+
+
+def _list_errors(message, values):
+    listed = ', '.join(str(value) for value in values[:MAX_LISTED_ERRORS])
+    if len(values) > MAX_LISTED_ERRORS:
+        listed += f' and {len(values) - MAX_LISTED_ERRORS} more'
+
+    return f'{message}: {listed}.'
+
+
+def validate_visits(visits):
+    """
+    return dictionary of site names and visits as floats, raising ValidationError listing every unknown site and
+    invalid (non-numeric, negative or infinite) number of visits
+    """
+    known_sites = constants.BASELINE_VISITS.index
+
+    unknown = [name for name in visits if name not in known_sites]
+    invalid = []
+    validated = {}
+    for name, value in visits.items():
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = math.nan
+        if not math.isfinite(value) or value < 0:
+            invalid.append(name)
+        validated[name] = value
+
+    errors = []
+    if unknown:
+        errors.append(_list_errors('Unknown sites', unknown))
+    if invalid:
+        errors.append(_list_errors('Visits have to be non-negative numbers for', invalid))
+    if errors:
+        raise ValidationError(errors)
+
+    return validated
+
+
+def save_baseline(user, name, visits):
+    """
+    create or update the baseline calibration of user with visits (a dictionary of site names and visits, see
+    validate_visits), in one transaction of bulk queries
+
+    sites left out of visits keep their visits, or those of BASELINE_VISITS in a new baseline
+    """
+    with transaction.atomic():
+        baseline_model = BaselineModel.objects.select_for_update().filter(user=user).first()
+        if baseline_model is None:
+            baseline_model = BaselineModel.objects.create(user=user, name=name)
+            visits = {**constants.BASELINE_VISITS['visits'].to_dict(), **visits}
+        elif baseline_model.name != name:
+            baseline_model.name = name
+            baseline_model.save(update_fields=['name'])
+
+        existing_sites = {site.name: site for site in BaselineSite.objects.filter(baseline_model=baseline_model)}
+
+        updated_sites = []
+        created_sites = []
+        for site_name, site_visits in visits.items():
+            site = existing_sites.get(site_name)
+            if site is None:
+                created_sites.append(BaselineSite(baseline_model=baseline_model, name=site_name, visits=site_visits))
+            elif site.visits != site_visits:
+                site.visits = site_visits
+                updated_sites.append(site)
+
+        BaselineSite.objects.bulk_create(created_sites, batch_size=500)
+        BaselineSite.objects.bulk_update(updated_sites, ['visits'], batch_size=500)
+
+        transaction.on_commit(lambda: invalidate_baseline_summary(user.pk))
+
+    return baseline_model
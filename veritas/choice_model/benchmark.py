@@ -0,0 +1,290 @@
+import platform
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from django.test import Client
+from django.urls import reverse
+
+from choice_model import constants
+from choice_model.cache import clear_incremental_engines, get_results_cache
+from choice_model.choicemodel import ChoiceModel
+from choice_model import dashapp_helpers, px_figures
+from choice_model.dashapp_helpers import create_bubble_plot_fig, create_equity_evaluation_fig, create_map_scatter_plot_fig, create_spatial_equity_fig
+from choice_model.geo import BlockGroups
+from choice_model.models import ModifiedSite, ModifiedSitesBundle, Site
+
+
+# area that synthetic custom sites are spread over (roughly Wake County)
+LATITUDES = (35.5, 36.1)
+LONGITUDES = (-79.0, -78.3)
+
+# spread (in miles) of the synthetic block groups around the block group they are copied from
+BLOCK_GROUP_SPREAD = 0.5
+
+
+def get_scaled_reference_data(block_groups, seed=0):
+    """
+    return reference datasets (to use with constants.REGISTRY.override) with block_groups block groups, made by
+    repeating the real block groups, each repetition moved by a random distance so they do not coincide
+    """
+    rng = np.random.default_rng(seed)
+    site_distances = constants.SITE_DISTANCES
+    population = constants.POPULATION
+
+    columns = np.arange(block_groups) % len(population)
+    repetitions = np.arange(block_groups) // len(population)
+    offsets = np.where(repetitions > 0, rng.normal(0, BLOCK_GROUP_SPREAD, block_groups), 0)
+
+    labels = [
+        label if repetition == 0 else f'{label} #{repetition}'
+        for label, repetition in zip(population.index[columns], repetitions)
+    ]
+
+    coordinates = constants.BLOCK_GROUP_COORDINATES[columns] + offsets[:, np.newaxis] / 69
+
+    return {
+        'SITE_DISTANCES': pd.DataFrame(
+            np.abs(site_distances.values[:, columns] + offsets), index=site_distances.index, columns=labels,
+        ),
+        'POPULATION': pd.DataFrame(population.values[columns], index=pd.Index(labels, name=population.index.name), columns=population.columns),
+        'BLOCK_GROUP_COORDINATES': coordinates,
+        'BLOCK_GROUPS': BlockGroups(labels, coordinates),
+    }
+
+
+def create_bundle(user, custom_sites, seed=0):
+    """
+    return a bundle of user with custom_sites randomly placed custom sites
+    """
+    rng = np.random.default_rng(seed)
+    bundle = ModifiedSitesBundle.objects.create(user=user, nickname=f'benchmark ({custom_sites} custom sites)')
+
+    for i in range(custom_sites):
+        ModifiedSite.objects.create(
+            bundle=bundle,
+            latitude=rng.uniform(*LATITUDES),
+            longitude=rng.uniform(*LONGITUDES),
+            name=f'Benchmark Site {i}',
+            acres=rng.uniform(5, 1000),
+            trails=int(rng.integers(0, 5)),
+            trail_miles=rng.uniform(0, 10),
+            picnic_area=int(rng.integers(0, 2)),
+            sports_facilities=int(rng.integers(0, 2)),
+            swimming_facilities=int(rng.integers(0, 2)),
+            boat_launch=int(rng.integers(0, 2)),
+            waterbody=int(rng.integers(0, 2)),
+            bathrooms=int(rng.integers(0, 3)),
+            playgrounds=int(rng.integers(0, 2)),
+        )
+
+    return bundle
+
+
+def clear_caches():
+    get_results_cache().clear()
+    clear_incremental_engines()
+
+
+def get_stages(user, bundle, client):
+    """
+    return list of (stage, function) for evaluating a bundle, in the order BundleList runs them
+
+    stages share one model, so each one is timed on top of the stages before it (as in a request)
+    """
+    baseline = ChoiceModel(user, bundle=None)
+    counterfactual = ChoiceModel(user, bundle=bundle)
+
+    def bubble_plot_fig():
+        baseline_visits = baseline.get_site_visits().assign(type='baseline')
+        counterfactual_visits = counterfactual.get_site_visits().assign(type='counterfactual')
+        return create_bubble_plot_fig(pd.concat([baseline_visits, counterfactual_visits]))
+
+    def map_scatter_plot_fig():
+        return create_map_scatter_plot_fig(counterfactual.get_site_visits(), counterfactual.get_site_locations())
+
+    def equity_evaluation_fig():
+        equity_evaluation = counterfactual.get_equity_evaluation()
+        return create_equity_evaluation_fig(equity_evaluation['average_utility_black'], equity_evaluation['average_utility_other'])
+
+    def spatial_equity_fig():
+        diff_bg_utility_black = counterfactual.get_block_group_utility()[['black_utility']] - baseline.get_block_group_utility()[['black_utility']]
+        diff_bg_utility_black['GEOID'] = constants.BLOCK_GROUPS.geoids
+        return create_spatial_equity_fig(diff_bg_utility_black)
+
+    def bundle_list():
+        # the whole request, starting without any cached results
+        clear_caches()
+        return client.get(reverse('bundles', kwargs={'bundle_id': bundle.id}))
+
+    return [
+        ('site_data', lambda: counterfactual.site_data),
+        ('custom_site_distances', lambda: counterfactual.custom_site_distances),
+        ('site_attractiveness', counterfactual._get_site_attractiveness),
+        ('site_visits', counterfactual.get_site_visits),
+        ('equity_evaluation', counterfactual.get_equity_evaluation),
+        ('utility_by_block_group', counterfactual.get_utility_by_block_group),
+        ('bubble_plot_fig', bubble_plot_fig),
+        ('map_scatter_plot_fig', map_scatter_plot_fig),
+        ('equity_evaluation_fig', equity_evaluation_fig),
+        ('spatial_equity_fig', spatial_equity_fig),
+        ('bundle_list', bundle_list),
+    ]
+
+
+def run_stages(user, bundle, client, trace_memory=False):
+    """
+    return dictionary with stages as keys and (seconds, peak bytes allocated or None) as values, for one evaluation
+    """
+    clear_caches()
+
+    measurements = {}
+    for stage, function in get_stages(user, bundle, client):
+        if trace_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        measurements[stage] = (seconds, peak)
+
+    return measurements
+
+
+def run(user, custom_sites, block_groups, repeat=5):
+    """
+    return list of results (one dictionary per stage) of benchmarking every combination of the number of
+    custom_sites and block_groups, where block_groups of None uses the real block groups
+
+    times are taken over repeat evaluations, peak memory from one more evaluation since tracing memory slows
+    every allocation down
+    """
+    client = Client()
+    client.force_login(user)
+
+    results = []
+    for block_groups_count in block_groups:
+        if block_groups_count is None or block_groups_count == len(constants.POPULATION):
+            datasets = {}
+        else:
+            datasets = get_scaled_reference_data(block_groups_count)
+
+        with constants.REGISTRY.override(**datasets):
+            for custom_sites_count in custom_sites:
+                bundle = create_bundle(user, custom_sites_count)
+                timings = [run_stages(user, bundle, client) for _ in range(repeat)]
+                memory = run_stages(user, bundle, client, trace_memory=True)
+
+                for stage in memory:
+                    seconds = [timing[stage][0] for timing in timings]
+                    results.append({
+                        'custom_sites': custom_sites_count,
+                        'block_groups': len(constants.POPULATION),
+                        'stage': stage,
+                        'seconds': statistics.median(seconds),
+                        'min_seconds': min(seconds),
+                        'peak_bytes': memory[stage][1],
+                    })
+
+                bundle.delete()
+
+    clear_caches()
+
+    return results
+
+
+def get_figure_arguments(seed=0):
+    """
+    return dictionary with the names of the figure builders (in dashapp_helpers & px_figures) as keys and the
+    arguments of a dashboard request as values, made from the reference data
+    """
+    rng = np.random.default_rng(seed)
+
+    baseline_visits = constants.BASELINE_VISITS[['visits']].rename_axis('name')
+    counterfactual_visits = baseline_visits * rng.uniform(0.9, 1.1, (len(baseline_visits), 1))
+    bg_utility_black = pd.DataFrame(
+        {'black_utility': rng.normal(0, 1, len(constants.POPULATION)), 'GEOID': constants.BLOCK_GROUPS.geoids},
+        index=constants.POPULATION.index,
+    )
+
+    return {
+        'create_bubble_plot_fig': (pd.concat([baseline_visits.assign(type='baseline'), counterfactual_visits.assign(type='counterfactual')]),),
+        'create_map_scatter_plot_fig': (counterfactual_visits, constants.SITE_LOCATIONS),
+        'create_equity_evaluation_fig': tuple(rng.normal(0, 1, 2)),
+        'create_spatial_equity_fig': (bg_utility_black,),
+        'create_site_map_fig': (Site(name='Benchmark Site', latitude=35.8, longitude=-78.6),),
+    }
+
+
+def run_figures(repeat=20):
+    """
+    return list of results (one dictionary per figure) of timing the figure builders of dashapp_helpers against the
+    plotly express ones of px_figures, on the figures of a dashboard request
+    """
+    results = []
+    for name, arguments in get_figure_arguments().items():
+        result = {'figure': name}
+        for builder, module in [('builder', dashapp_helpers), ('px', px_figures)]:
+            function = getattr(module, name)
+
+            # the first call is left out, since it loads whatever the builder caches
+            function(*arguments)
+
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function(*arguments)
+                seconds.append(time.perf_counter() - start)
+
+            result[f'{builder}_seconds'] = statistics.median(seconds)
+
+        results.append(result)
+
+    return results
+
+
+def get_environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, baseline_results, threshold, min_seconds=0.001, min_bytes=64 * 1024):
+    """
+    return list of messages for every stage whose median time or peak memory grew by more than threshold (a fraction)
+    over baseline_results. changes smaller than min_seconds or min_bytes are ignored, since they are mostly noise
+    """
+    baseline_results = {
+        (result['custom_sites'], result['block_groups'], result['stage']): result for result in baseline_results
+    }
+
+    regressions = []
+    for result in results:
+        key = (result['custom_sites'], result['block_groups'], result['stage'])
+        if key not in baseline_results:
+            continue
+        baseline_result = baseline_results[key]
+        label = f"{result['stage']} ({result['custom_sites']} custom sites, {result['block_groups']} block groups)"
+
+        seconds, baseline_seconds = result['seconds'], baseline_result['seconds']
+        if seconds - baseline_seconds > max(threshold * baseline_seconds, min_seconds):
+            regressions.append(f'{label}: {baseline_seconds * 1000:.1f} ms -> {seconds * 1000:.1f} ms')
+
+        peak, baseline_peak = result['peak_bytes'], baseline_result['peak_bytes']
+        if peak is not None and baseline_peak is not None and peak - baseline_peak > max(threshold * baseline_peak, min_bytes):
+            regressions.append(f'{label}: {baseline_peak / 1024:.0f} KiB -> {peak / 1024:.0f} KiB peak memory')
+
+    return regressions
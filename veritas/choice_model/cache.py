@@ -0,0 +1,217 @@
+import hashlib
+import pickle
+import threading
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# alias of the cache (see CACHES in settings) used to keep model results between requests
+RESULTS_CACHE = 'choice_model'
+
+# attributes of a modified site that the results of a bundle depend on
+MODIFIED_SITE_FIELDS = [
+    'name',
+    'latitude',
+    'longitude',
+    'acres',
+    'trails',
+    'trail_miles',
+    'picnic_area',
+    'sports_facilities',
+    'swimming_facilities',
+    'boat_launch',
+    'waterbody',
+    'bathrooms',
+    'playgrounds',
+]
+
+
+# total size of the pickled values of each BoundedLocMemCache, shared like the entries themselves (see LocMemCache)
+# between the instances every thread gets for the same cache
+_sizes = {}
+
+
+class BoundedLocMemCache(LocMemCache):
+    """
+    local memory cache that also evicts the least recently used entries once the total size of
+    the stored (pickled) values exceeds OPTIONS['MAX_BYTES']
+
+    the total is kept up to date as entries are added, replaced and removed, so writes need not sum every entry
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._name = name
+        self._max_bytes = int(params.get('OPTIONS', {}).get('MAX_BYTES', 32 * 1024 * 1024))
+        with self._lock:
+            _sizes.setdefault(name, sum(len(pickled) for pickled in self._cache.values()))
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        # a replaced entry no longer counts
+        self._delete(key)
+        super()._set(key, value, timeout)
+        _sizes[self._name] += len(value)
+
+        # most recently used entries are kept at the front, so evict from the back
+        while _sizes[self._name] > self._max_bytes and len(self._cache) > 1:
+            evicted_key, pickled = self._cache.popitem()
+            del self._expire_info[evicted_key]
+            _sizes[self._name] -= len(pickled)
+
+    def _delete(self, key):
+        pickled = self._cache.get(key)
+        deleted = super()._delete(key)
+        if deleted:
+            _sizes[self._name] -= len(pickled)
+
+        return deleted
+
+    def _cull(self):
+        # only once MAX_ENTRIES is reached, which then drops a fraction of the entries
+        super()._cull()
+        _sizes[self._name] = sum(len(pickled) for pickled in self._cache.values())
+
+    def incr(self, key, delta=1, version=None):
+        # as LocMemCache.incr, which replaces the value without going through _set
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                self._delete(key)
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(self._cache[key]) + delta
+            pickled = pickle.dumps(new_value, self.pickle_protocol)
+            _sizes[self._name] += len(pickled) - len(self._cache[key])
+            self._cache[key] = pickled
+            self._cache.move_to_end(key, last=False)
+        return new_value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            _sizes[self._name] = 0
+
+def get_results_cache():
+    return caches[RESULTS_CACHE]
+
+
+def get_baseline_hash(baseline_sites):
+    """
+    return a hash of the calibration visits of a custom baseline, or 'default' when the user has none
+    """
+    baseline_sites = sorted((site.name, site.visits) for site in baseline_sites)
+    if not baseline_sites:
+        return 'default'
+
+    baseline_hash = hashlib.sha1()
+    for name, visits in baseline_sites:
+        baseline_hash.update(f'{name}\0{visits!r}\0'.encode())
+
+    return baseline_hash.hexdigest()
+
+
+def get_bundle_hash(modified_sites):
+    """
+    return a hash of the attributes of every modified site in a bundle, bundles with identical edits share a hash
+    """
+    modified_sites = sorted(tuple(getattr(site, field) for field in MODIFIED_SITE_FIELDS) for site in modified_sites)
+
+    bundle_hash = hashlib.sha1()
+    for modified_site in modified_sites:
+        bundle_hash.update(repr(modified_site).encode())
+
+    return bundle_hash.hexdigest()
+
+
+def _baseline_key(user_id):
+    return f'baseline:{user_id}'
+
+
+def get_baseline_summary(user_id, baseline_hash, compute):
+    """
+    return the cached baseline summary of a user, calling compute() to create it on a miss
+
+    the entry is only used if it was computed from the same baseline calibration
+    """
+    cache = get_results_cache()
+    key = _baseline_key(user_id)
+
+    cached = cache.get(key)
+    if cached is not None and cached[0] == baseline_hash:
+        return cached[1]
+
+    summary = compute()
+    cache.set(key, (baseline_hash, summary))
+
+    return summary
+
+
+def invalidate_baseline_summary(user_id):
+    """
+    drop the cached baseline summary of a user, called whenever their baseline calibration changes
+    """
+    get_results_cache().delete(_baseline_key(user_id))
+
+
+def _scenario_key(baseline_hash, bundle_hash):
+    return f'scenario:{baseline_hash}:{bundle_hash}'
+
+
+def get_bundle_summary(baseline_hash, bundle_hash, compute):
+    """
+    return the cached summary of a bundle, calling compute() to create it on a miss
+
+    summaries are keyed by the content of the bundle and baseline only, so bundles with identical modified
+    sites share one entry, and an entry never outlives the modified sites it was computed from no matter
+    which process (or job thread) changed them
+    """
+    cache = get_results_cache()
+    scenario_key = _scenario_key(baseline_hash, bundle_hash)
+
+    summary = cache.get(scenario_key)
+    if summary is None:
+        summary = compute()
+        cache.set(scenario_key, summary)
+
+    return summary
+
+
+# incremental engines of recently evaluated bundles, see get_incremental_engine
+_incremental_engines = OrderedDict()
+_incremental_engines_lock = threading.Lock()
+
+
+def get_incremental_engine(bundle_id, baseline_hash, build):
+    """
+    return the incremental engine (see IncrementalChoiceModelEngine) this process keeps for a bundle, calling build()
+    to create one when there is none for the same baseline calibration
+
+    engines hold full (sites x block groups) arrays that are changed in place, so unlike summaries they stay in the
+    memory of the process, which keeps the CHOICE_MODEL_INCREMENTAL_ENGINES most recently used ones
+    """
+    key = (bundle_id, baseline_hash)
+    with _incremental_engines_lock:
+        engine = _incremental_engines.get(key)
+        if engine is not None:
+            _incremental_engines.move_to_end(key)
+            return engine
+
+    engine = build()
+
+    with _incremental_engines_lock:
+        # another thread may have built the same engine in the meantime
+        engine = _incremental_engines.setdefault(key, engine)
+        _incremental_engines.move_to_end(key)
+        while len(_incremental_engines) > settings.CHOICE_MODEL_INCREMENTAL_ENGINES:
+            _incremental_engines.popitem(last=False)
+
+    return engine
+
+
+def clear_incremental_engines():
+    with _incremental_engines_lock:
+        _incremental_engines.clear()
@@ -1,191 +1,258 @@
-import h3
 import numpy as np
+import pandas as pd
+
+from functools import cached_property
 
 from choice_model.models import *
-from choice_model.constants import *
-from sklearn.linear_model import LinearRegression
+from choice_model import constants
+from choice_model.cache import MODIFIED_SITE_FIELDS, get_baseline_hash, get_baseline_summary, get_bundle_hash, get_bundle_summary, get_incremental_engine
+from choice_model.engine import ChoiceModelBatchEngine, ChoiceModelEngine, ChoiceModelResults, ChoiceModelSummary, IncrementalChoiceModelEngine
+from choice_model.queries import ScenarioData
+from choice_model.timing import stage
 
 
 class ChoiceModel():
 
-    def __init__(self, user, bundle=None):
+    def __init__(self, user, bundle=None, data=None):
         """
         if using bundle_id of None, all calculations will return the baseline
+
+        data is the ScenarioData of user (loaded along with bundle), which is loaded here when not given
         """
-        self.baseline_model = self._get_baseline_model(user)
-        self.baseline_sites = self._get_baseline_sites()
-        self.modified_sites = self._get_modified_sites(bundle)
+        if data is None:
+            data = ScenarioData.load(user, [bundle])
 
-        self.site_data = self._update_site_data()
-        self.distances = self._update_distances()
+        self.user = user
+        self.bundle = bundle
 
-    def _get_baseline_model(self, user):
+        self.baseline_model = data.baseline_model
+        self.baseline_sites = data.baseline_sites
+        self.modified_sites = data.get_modified_sites(bundle)
+
+    @classmethod
+    async def aload(cls, user, bundle=None):
         """
-        check if there are any recalibrated baseline models belonging to the user
+        return model of user and bundle with its rows loaded through the async ORM, for use in async views
         """
-        if BaselineModel.objects.filter(user=user).exists():
-            return BaselineModel.objects.get(user=user)
-        return None
+        return cls(user, bundle, await ScenarioData.aload(user, [bundle]))
 
-    def _get_baseline_sites(self):
-        return BaselineSite.objects.filter(baseline_model=self.baseline_model)
+    @classmethod
+    @stage('model')
+    def evaluate_many(cls, user, bundles, batch_size=8):
+        """
+        return list of ChoiceModelSummary, one for each bundle (None meaning the baseline), evaluated together
 
-    def _get_modified_sites(self, bundle):
-        if bundle is not None:
-            return ModifiedSite.objects.filter(bundle=bundle)
-        return []
+        the baseline calibration and modified sites are loaded once for all bundles, and the bundles are evaluated
+        batch_size at a time as stacked arrays, which bounds the memory used by the (bundles x sites x block groups) arrays
+        """
+        data = ScenarioData.load(user, bundles)
+        baseline = cls(user, None, data)
+        models = [cls(user, bundle, data) for bundle in bundles]
+
+        # every model has the same existing sites, followed by its own custom sites
+        sites = len(constants.SITE_DATA)
+        true_visits = baseline._get_true_visits(constants.SITE_DATA.index)
+
+        summaries = []
+        for start in range(0, len(models), batch_size):
+            batch = models[start:start + batch_size]
+            engine = ChoiceModelBatchEngine(
+                site_names=constants.SITE_DATA.index.values,
+                site_attributes=np.stack([model.site_data.values[:sites] for model in batch]),
+                site_distances=constants.SITE_DISTANCES.values,
+                true_visits=true_visits,
+                site_coefficients=constants.SITE_COEFFICIENTS.values,
+                custom_sites=[
+                    (model.site_data.index.values[sites:], model.site_data.values[sites:], model.custom_site_distances)
+                    for model in batch
+                ],
+            )
+            summaries += engine.get_summaries(
+                constants.POPULATION['Black'].values,
+                constants.POPULATION['Other'].values,
+                [model._get_custom_site_locations() for model in batch],
+            )
+
+        return summaries
+
+    @cached_property
+    def site_data(self):
+        return self._update_site_data()
+
+    @cached_property
+    def custom_site_distances(self):
+        return self._get_custom_site_distances()
 
     def _update_site_data(self):
         """
         return updated site data with new sites added into dataframe and ones with changed values updated accordingly
         """
-        updated_site_data = SITE_DATA.copy()
+        updated_site_data = constants.SITE_DATA.copy()
         for modified_site in self.modified_sites:
 
             # either update row if site already exists or add row for new sites
-            modified_site_name = modified_site.name
-            modified_site_attributes = [
-                modified_site.acres, 
-                modified_site.trails, 
-                modified_site.trail_miles, 
-                modified_site.picnic_area, 
-                modified_site.sports_facilities,
-                modified_site.swimming_facilities,
-                modified_site.boat_launch,
-                modified_site.waterbody,
-                modified_site.bathrooms,
-                modified_site.playgrounds,
-            ]
-            updated_site_data.loc[modified_site_name] = modified_site_attributes 
+            updated_site_data.loc[modified_site.name] = self._get_modified_site_attributes(modified_site)
 
         return updated_site_data
 
-    def _update_distances(self):
+    @staticmethod
+    def _get_modified_site_attributes(modified_site):
         """
-        for any sites that are added by the user, the distances matrix will have to add a new row with the new distances
+        return attributes of a modified site, in the column order of SITE_DATA
         """
-        updated_distances = DISTANCES.copy()
-        for modified_site in self.modified_sites:
-            modified_site_name = modified_site.name
-
-            # ensure that only custom added sites are being added
-            if modified_site_name not in SITE_DATA.index:
-                new_distances = []
-                for block_group in DISTANCES.columns:
+        return [
+            modified_site.acres,
+            modified_site.trails,
+            modified_site.trail_miles,
+            modified_site.picnic_area,
+            modified_site.sports_facilities,
+            modified_site.swimming_facilities,
+            modified_site.boat_launch,
+            modified_site.waterbody,
+            modified_site.bathrooms,
+            modified_site.playgrounds,
+        ]
+
+    def _get_custom_site_distances(self):
+        """
+        return (custom sites x block groups) distances of the sites added by the user, in the order they appear in site_data
 
-                    # TODO: remove this? examine this 
-                    # this can only be removed once models save block group in addition to lat/lon
+        rows of existing sites are read straight from SITE_DISTANCES, so only these rows are specific to the model
+        """
+        # distances of custom sites are stored with the site when it is saved
+        custom_sites = {site.name: site for site in self.modified_sites if site.is_custom}
+        if not custom_sites:
+            return np.empty((0, constants.SITE_DISTANCES.shape[1]))
 
-                    block_group_lat, block_group_lon = float(block_group.split(', ')[-2]), float(block_group.split(', ')[-1])
-                    modified_site_lat, modified_site_lon = modified_site.latitude, modified_site.longitude
-                    
-                    # calculate distance between the two points first in meters, and then convert to mile(s)
-                    distance = h3.point_dist((block_group_lat, block_group_lon), (modified_site_lat, modified_site_lon))
-                    distance *= 0.000621371
+        return np.vstack([site.get_distances() for site in custom_sites.values()])
 
-                    new_distances.append(distance)
+    def _get_true_visits(self, site_names):
+        """
+        return true visits for every site in site_names, used to calibrate the model
+        """
+        # use pre-saved baseline data if user does not add baseline model, otherwise use true trips according to selected baseline
+        if self.baseline_model is None:
+            baseline_visits = constants.BASELINE_VISITS['visits']
+        else:
+            baseline_visits = pd.Series({site.name: site.visits for site in self.baseline_sites}, dtype=float)
 
-                # add the row of new distances
-                updated_distances.loc[modified_site_name] = new_distances
+        # custom added sites have no true visits
+        return baseline_visits.reindex(site_names).fillna(0).values
 
-        return updated_distances
+    def _get_engine(self):
+        """
+        return the array-backed engine for the current site data and distances
+        """
+        # site_data holds every existing site (in the order of SITE_DISTANCES) followed by the custom sites
+        return ChoiceModelEngine(
+            site_names=self.site_data.index.values,
+            site_attributes=self.site_data.values,
+            site_distances=[constants.SITE_DISTANCES.values, self.custom_site_distances],
+            true_visits=self._get_true_visits(self.site_data.index),
+            site_coefficients=constants.SITE_COEFFICIENTS.values,
+        )
+
+    def _get_incremental_engine(self):
+        """
+        return the incremental engine of the bundle, kept by the process between evaluations so editing a site
+        only recomputes that site
+        """
+        return get_incremental_engine(self.bundle.pk, self.baseline_hash, self._build_incremental_engine)
 
-    def _get_site_attractiveness(self):
+    def _build_incremental_engine(self):
         """
-        return attractiveness of each site (combination of site characteristics + distance + ...)
+        return an incremental engine of the existing sites, before any modified sites are applied
+        """
+        return IncrementalChoiceModelEngine(
+            site_names=constants.SITE_DATA.index.values,
+            site_attributes=constants.SITE_DATA.values,
+            site_distances=[constants.SITE_DISTANCES.values],
+            true_visits=self._get_true_visits(constants.SITE_DATA.index),
+            site_coefficients=constants.SITE_COEFFICIENTS.values,
+        )
+
+    def _get_edits(self):
+        """
+        return the modified sites as edits, see IncrementalChoiceModelEngine.apply
         """
-        # update acres using a scalar
-        acreage_scalar = self.site_data['acres'].where(self.site_data['acres'] >= 3000, 1)
-        acreage_scalar = acreage_scalar.where(self.site_data['acres'] < 3000, 0.2)
-        self.site_data['acres'] = self.site_data['acres'].multiply(acreage_scalar)
+        # later modified sites of the same name take precedence, as in site_data
+        edits = {}
+        for modified_site in self.modified_sites:
+            edits[modified_site.name] = (
+                tuple(getattr(modified_site, field) for field in MODIFIED_SITE_FIELDS),
+                self._get_modified_site_attributes(modified_site),
+                modified_site.get_distances() if modified_site.is_custom else None,
+            )
 
-        # calculate site_product from site_data and site_coefficients
-        site_product = self.site_data.mul(SITE_COEFFICIENTS.values, axis=1).sum(axis=1)
-        site_product = site_product.to_frame().rename(columns={0: "Product"})
+        return edits
 
-        # calculate distance_product from distance_coefficient and distances data
-        distance_coefficient = np.repeat(-0.011, DISTANCES.shape[1])
-        distance_product = self.distances.mul(distance_coefficient, axis=1)
+    @cached_property
+    def results(self):
+        """
+        lazily evaluated results of the model, computed at most once per ChoiceModel
+        """
+        with stage('model'):
+            if self.bundle is None:
+                return ChoiceModelResults(self._get_engine(), constants.POPULATION['Black'].values, constants.POPULATION['Other'].values)
+
+            # bundles are evaluated by applying the modified sites that changed since the last evaluation
+            engine = self._get_incremental_engine()
+            with engine.lock:
+                engine.apply(self._get_edits())
+                return engine.get_results(constants.POPULATION['Black'].values, constants.POPULATION['Other'].values)
+
+    @cached_property
+    def summary(self):
+        """
+        results shown on the dashboard, the baseline is shared between requests through the results cache
+        """
+        if self.bundle is None:
+            return get_baseline_summary(self.user.pk, self.baseline_hash, self._summarize)
+        return get_bundle_summary(self.baseline_hash, get_bundle_hash(self.modified_sites), self._summarize)
 
-        # in both distance product and site product, used to add together
-        ds_in_both = distance_product.index.intersection(site_product.index)
+    def _summarize(self):
+        return ChoiceModelSummary.from_results(self.results, self._get_custom_site_locations())
 
-        # sort each so that they have matching index order
-        site_product = site_product.sort_index()
-        distance_product = distance_product.loc[ds_in_both].sort_index()
+    def _get_custom_site_locations(self):
+        return {
+            modified_site.name: [modified_site.latitude, modified_site.longitude]
+            for modified_site in self.modified_sites if modified_site.name not in constants.SITE_LOCATIONS.index
+        }
 
-        site_attractiveness = distance_product.add(site_product.values, axis=1)
+    @cached_property
+    def baseline_hash(self):
+        return get_baseline_hash(self.baseline_sites)
 
-        # calibrate site_attractiveness using baseline true visits data and predicted SA
-        true_visits = []
-        pred_site_attractiveness = []
+    def _to_frame(self, values):
+        """
+        wrap a (sites x block groups) array from the results as a dataframe
+        """
+        return pd.DataFrame(values, index=pd.Index(self.results.site_names, name='name'), columns=constants.SITE_DISTANCES.columns)
 
-        # use pre-saved baseline data if user does not add baseline model, otherwise use true trips according to selected baseline
-        new_baseline_sites = {site.name: site.visits for site in BaselineSite.objects.filter(baseline_model=self.baseline_model)}
-        for site in site_attractiveness.index:
-
-            # occurs when dealing with custom added site
-            if site not in BASELINE_VISITS.index:
-                true_visits.append(0)
-            else:
-                if self.baseline_model is None:
-                    true_visits.append(BASELINE_VISITS.loc[site].visits)
-                else:
-                    true_visits.append(new_baseline_sites[site])
-
-            # deals with error since there are duplicated of sites in initial data
-            sa = site_attractiveness.loc[site].sum()
-            if isinstance(sa, float):
-                pred_site_attractiveness.append(sa)
-            else:
-                pred_site_attractiveness.append(sa.values[0])
-
-        # calculate calibration value
-        true_trips = np.array(true_visits).reshape((-1, 1))
-        pred_SA = np.array(pred_site_attractiveness).reshape((-1, 1))
-        model = LinearRegression().fit(true_trips, pred_SA)
-        B0 = model.intercept_
-        B1 = model.coef_
-        true_SA = (true_trips - B0)/B1
-        SA_adjuster = true_SA - pred_SA
-
-        exp_site_attractiveness = np.exp(site_attractiveness)
-        calibrated_attractiveness = exp_site_attractiveness.add(SA_adjuster, axis=1)
-            
-        return calibrated_attractiveness
+    def _get_site_attractiveness(self):
+        """
+        return attractiveness of each site (combination of site characteristics + distance + ...)
+        """
+        return self._to_frame(self.results.attractiveness)
 
     def get_site_visitation_probability(self):
-        site_attractiveness = self._get_site_attractiveness()
-
-        visitation_probability = site_attractiveness.div(site_attractiveness.sum(axis=0), axis=1)
-        visitation_probability[visitation_probability < 0] = 0
-
-        # check edge case where one site has SA of infinity
-        if np.isinf(site_attractiveness).values.sum() > 0:
-            visitation_probability = visitation_probability.fillna(1.0)
-
-        return visitation_probability
+        return self._to_frame(self.results.visitation_probability)
 
     def get_site_visits(self):
         """
         return dictionary with site names as keys and their respective visits from population as values
         """
-        # use visitation probabilities along with population numbers to find number of people
-        visitation_probability = self.get_site_visitation_probability()
-        visits = visitation_probability.multiply(POPULATION.sum(axis=1)).sum(axis=1).to_frame().rename(columns={0: 'visits'})
-
-        return visits
+        return pd.DataFrame({'visits': self.summary.visits}, index=pd.Index(self.summary.site_names, name='name'))
 
     def get_site_locations(self):
         """
         return dataframe with index as site name, columns as the lat & lon
         """
-        site_locations = SITE_LOCATIONS.copy()
-        for modified_site in self.modified_sites:
+        site_locations = constants.SITE_LOCATIONS.copy()
 
-            # only have to deal with custom added sites
-            if modified_site.name not in site_locations.index:
-                site_locations.loc[modified_site.name] = [modified_site.latitude, modified_site.longitude]
+        # only have to deal with custom added sites
+        for name, location in self.summary.custom_site_locations.items():
+            site_locations.loc[name] = location
 
         return site_locations
 
@@ -193,50 +260,16 @@ class ChoiceModel():
         """
         return equity evaluations for black and non-black groups
         """
-        exp_site_attractiveness = self._get_site_attractiveness()
-        exp_site_attractiveness[exp_site_attractiveness <= 0] = 1
-        utility_index = np.log(exp_site_attractiveness)
-
-        visitation_probability = self.get_site_visitation_probability()
-
-        all_trips_black = POPULATION['Black'] * visitation_probability
-        all_trips_other = POPULATION['Other'] * visitation_probability
-
-        total_utility_black = (all_trips_black * utility_index).sum().sum()
-        total_utility_other = (all_trips_other * utility_index).sum().sum()
-
-        # Total Trips by Equity Group
-        total_trips_by_equity_group = POPULATION.sum()
-
-        # Average Utility by Equity Group
-        average_utility_black = total_utility_black / total_trips_by_equity_group['Black']
-        average_utility_other = total_utility_other / total_trips_by_equity_group['Other']
-
-        # Exponentiate and find ratio
-        exp_average_utility_black = np.exp(average_utility_black)
-        exp_average_utility_other = np.exp(average_utility_other)
-
-        exp_ratio_black = exp_average_utility_black / (exp_average_utility_black + exp_average_utility_other)
-        exp_ratio_other = exp_average_utility_other / (exp_average_utility_black + exp_average_utility_other)
-
-        equity_evaluation = {
-            'average_utility_black': exp_ratio_black, 
-            'average_utility_other': exp_ratio_other
-        }
-        
-        return equity_evaluation
+        return dict(self.summary.equity_evaluation)
 
     def get_utility_by_block_group(self):
-        exp_site_attractiveness = self._get_site_attractiveness()
-        exp_site_attractiveness[exp_site_attractiveness <= 0] = 1
-        utility_index = np.log(exp_site_attractiveness)
-
-        visitation_probability = self.get_site_visitation_probability()
-
-        all_trips_black = POPULATION['Black'] * visitation_probability
-        all_trips_other = POPULATION['Other'] * visitation_probability
+        return self._to_frame(self.results.utility_weighted_trips_black), self._to_frame(self.results.utility_weighted_trips_other)
 
-        utility_weighted_trips_black = all_trips_black * utility_index
-        utility_weighted_trips_other = all_trips_other * utility_index
-
-        return utility_weighted_trips_black, utility_weighted_trips_other       
+    def get_block_group_utility(self):
+        """
+        return dataframe with index as block group, columns as the total utility of black and other groups
+        """
+        return pd.DataFrame({
+            'black_utility': self.summary.block_group_utility_black,
+            'other_utility': self.summary.block_group_utility_other,
+        }, index=constants.POPULATION.index)
@@ -0,0 +1,55 @@
+import contextvars
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from choice_model.profiling import profile_call
+
+
+# threads shared by all requests of the process, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.CHOICE_MODEL_REQUEST_THREADS, thread_name_prefix='choice-model')
+        return _executor
+
+
+def run_concurrently(*functions):
+    """
+    return list of the results of calling every function, run concurrently on the threads of the process
+    (CHOICE_MODEL_REQUEST_THREADS, one after another when it is below 2)
+
+    the first function runs on the calling thread, the others see its context (so their stages are timed as part of
+    the request). functions must not use the database, which only the calling thread has a connection to, nor call
+    run_concurrently themselves
+    """
+    if settings.CHOICE_MODEL_REQUEST_THREADS < 2 or len(functions) < 2:
+        return [function() for function in functions]
+
+    executor = _get_executor()
+    futures = [executor.submit(contextvars.copy_context().run, profile_call, function) for function in functions[1:]]
+
+    # wait for every function, even when one fails, so none of them outlives the request
+    try:
+        first = functions[0]()
+    finally:
+        wait(futures)
+
+    return [first] + [future.result() for future in futures]
+
+
+async def run_in_thread(function, *args):
+    """
+    return function(*args) run on a thread of its own, so the event loop serves other requests in the meantime
+
+    as with run_concurrently, function must not use the database (load what it needs with the async ORM beforehand)
+    """
+    return await sync_to_async(profile_call, thread_sensitive=False)(function, *args)
@@ -1,13 +1,51 @@
-import pandas as pd
 import json
+import logging
 
 from pathlib import Path
 
+from choice_model.geo import BlockGroups, load_geometries
+from choice_model.reference import ReferenceRegistry, load_store
+
 
 CURRENT_PATH = Path(__file__).parent.resolve() / 'data'
 
+# reference data is converted from the parquet files once into memory-mapped arrays (see reference.py),
+# so every dataframe below is read-only and shared between processes
+STORE_PATH = CURRENT_PATH / 'store'
+
+# every dataset below is loaded on first access (e.g. constants.SITE_DATA) and kept afterwards, so
+# processes that never touch the data (migrations, most management commands) never pay for it
+REGISTRY = ReferenceRegistry()
+
+logger = logging.getLogger(__name__)
+
+
+def __getattr__(name):
+    if name in REGISTRY:
+        return REGISTRY.get(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def warm_up(names=None, trace_memory=False):
+    """
+    load reference data ahead of the first request (called by web workers on startup), see REGISTRY.warm_up
+    """
+    REGISTRY.warm_up(names, trace_memory)
+
+    for name, stats in REGISTRY.report().items():
+        if stats['loaded'] and stats['bytes'] is not None:
+            logger.info('loaded %s in %.3fs (%d bytes)', name, stats['seconds'], stats['bytes'])
+        elif stats['loaded']:
+            logger.info('loaded %s in %.3fs', name, stats['seconds'])
+
+
+@REGISTRY.register('REFERENCE_DATA')
+def _load_reference_data():
+    return load_store(CURRENT_PATH, STORE_PATH)
+
+
 # SITE_DATA
-# 322 x 10: each row is site name, column is attribute
+# 322 x 10: each row is site name (sorted), column is attribute
 """
 name    acres    trails    ...
 ------------------------------
@@ -15,15 +53,38 @@ jordan| 911.60   ...
 twin  | ...
 ...
 """
-SITE_DATA = pd.read_parquet(CURRENT_PATH / 'site_data.parquet')
+@REGISTRY.register('SITE_DATA')
+def _load_site_data():
+    return REGISTRY.get('REFERENCE_DATA')['site_data']
+
 
-# SITE_COEFFICIENTS 
+# SITE_COEFFICIENTS
 # 1 x 10: each column is attribute with the coefficient as value
-SITE_COEFFICIENTS = pd.read_parquet(CURRENT_PATH / 'site_coefficients.parquet')
+@REGISTRY.register('SITE_COEFFICIENTS')
+def _load_site_coefficients():
+    return REGISTRY.get('REFERENCE_DATA')['site_coefficients']
+
 
 # DISTANCES
 # 920 x 596: distance matrix containing (sites + block groups) on row index and (block groups only) on column index
-DISTANCES = pd.read_parquet(CURRENT_PATH / 'distances.parquet')
+@REGISTRY.register('DISTANCES')
+def _load_distances():
+    return REGISTRY.get('REFERENCE_DATA')['distances']
+
+
+# SITE_DISTANCES
+# 322 x 596: rows of DISTANCES belonging to each site, in the order of SITE_DATA
+@REGISTRY.register('SITE_DISTANCES')
+def _load_site_distances():
+    return REGISTRY.get('REFERENCE_DATA')['site_distances']
+
+
+# BLOCK_GROUP_COORDINATES
+# 596 x 2: latitude & longitude of each block group, parsed from (and in the order of) the columns of DISTANCES
+@REGISTRY.register('BLOCK_GROUP_COORDINATES')
+def _load_block_group_coordinates():
+    return REGISTRY.get('DISTANCES').columns.to_series().str.split(', ', expand=True)[[2, 3]].astype(float).values
+
 
 # MODEL_POPULATION
 # 596 x 2
@@ -34,17 +95,48 @@ bg 1  | 215   ...
 bg 2  | ...
 ...
 """
-POPULATION = pd.read_parquet(CURRENT_PATH / 'model_population.parquet')
+@REGISTRY.register('POPULATION')
+def _load_population():
+    return REGISTRY.get('REFERENCE_DATA')['population']
+
 
 # WAKE_BG_GEOJSON
 # .geojson file containing shapes of all the block groups in NC (according to 2020 census)
-with open(CURRENT_PATH / 'wake_bg.json') as f:
-    WAKE_BG_GEOJSON = json.load(f)
+@REGISTRY.register('WAKE_BG_GEOJSON')
+def _load_wake_bg_geojson():
+    with open(CURRENT_PATH / 'wake_bg.json') as f:
+        return json.load(f)
+
+
+# BLOCK_GROUPS
+# registry of the 596 block groups (GEOID <-> column of DISTANCES & row of POPULATION <-> coordinates) with a
+# spatial index over their shapes from WAKE_BG_GEOJSON, see geo.BlockGroups
+@REGISTRY.register('BLOCK_GROUPS')
+def _load_block_groups():
+    return BlockGroups(
+        REGISTRY.get('DISTANCES').columns,
+        REGISTRY.get('BLOCK_GROUP_COORDINATES'),
+        REGISTRY.get('WAKE_BG_GEOJSON')['features'],
+    )
+
+
+# BLOCK_GROUP_GEOJSON
+# shapes of the block groups of the model simplified at each of geo.RESOLUTIONS (keys), as served to browsers,
+# which are built once into the store from wake_bg.json (see geo.build_geometries)
+@REGISTRY.register('BLOCK_GROUP_GEOJSON')
+def _load_block_group_geojson():
+    return load_geometries(CURRENT_PATH / 'wake_bg.json', STORE_PATH, REGISTRY.get('BLOCK_GROUPS'))
+
 
 # SITE_LOCATIONS
 # rows are site name, columns are respective latitude & longitude
-SITE_LOCATIONS = pd.read_parquet(CURRENT_PATH / 'site_locations.parquet')
+@REGISTRY.register('SITE_LOCATIONS')
+def _load_site_locations():
+    return REGISTRY.get('REFERENCE_DATA')['site_locations']
+
 
 # BASELINE_VISITS
 # index is site name, column is visits
-BASELINE_VISITS = pd.read_parquet(CURRENT_PATH / 'baseline_visits.parquet').set_index('site_name')
+@REGISTRY.register('BASELINE_VISITS')
+def _load_baseline_visits():
+    return REGISTRY.get('REFERENCE_DATA')['baseline_visits']
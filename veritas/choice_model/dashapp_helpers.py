@@ -1,21 +1,82 @@
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
+import plotly.io as pio
 
-from choice_model.constants import WAKE_BG_GEOJSON
+from functools import lru_cache
+
+from choice_model import constants
+from choice_model.geo import get_block_group_geojson_url
+
+
+# zoom of the spatial equity map, showing the whole county, which picks the resolution of its block group shapes
+SPATIAL_EQUITY_ZOOM = 8
+
+# largest marker of the bubble & scatter plots, as px.scatter sizes them by default
+SIZE_MAX = 20
+
+# maps fill their whole figure
+DOMAIN = {'x': [0.0, 1.0], 'y': [0.0, 1.0]}
+
+# figures below are plain dictionaries, laid out as plotly express would (see px_figures.py, which tests.py checks
+# them against), since building them through plotly express validates and merges the whole (mostly constant) layout
+# on every request
+
+
+@lru_cache(maxsize=None)
+def get_template():
+    """
+    return default plotly template as a dictionary, which every figure carries
+    """
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+def get_colorscale(colors):
+    """
+    return colorscale spreading colors evenly, as plotly express does with color_continuous_scale
+    """
+    return [[i / (len(colors) - 1), color] for i, color in enumerate(colors)]
+
+
+def get_sizeref(sizes):
+    return float(sizes.max()) / SIZE_MAX ** 2 if len(sizes) else 0
 
 
 def create_bubble_plot_fig(visits):
-    bubble_fig = px.scatter(
-        x=visits.index,
-        y=visits['visits'],
-        size=visits['visits'],
-        color=visits['type'],
-    )
-    bubble_fig.update_layout(margin={'l': 20, 'r': 20, 'b': 5, 't': 5}, height=700)
-    bubble_fig.update_yaxes(ticks="outside", ticklen=50)
-    
-    return bubble_fig
+    names = visits.index.values
+    types = visits['type'].values
+    sizes = visits['visits'].values
+    sizeref = get_sizeref(sizes)
+    colorway = get_template()['layout']['colorway']
+
+    data = []
+    for i, trace_type in enumerate(pd.unique(types)):
+        selected = types == trace_type
+        data.append({
+            'hovertemplate': f'color={trace_type}<br>x=%{{x}}<br>y=%{{y}}<br>size=%{{marker.size}}<extra></extra>',
+            'legendgroup': trace_type,
+            'marker': {'color': colorway[i % len(colorway)], 'size': sizes[selected].tolist(), 'sizemode': 'area', 'sizeref': sizeref, 'symbol': 'circle'},
+            'mode': 'markers',
+            'name': trace_type,
+            'orientation': 'v',
+            'showlegend': True,
+            'x': names[selected].tolist(),
+            'xaxis': 'x',
+            'y': sizes[selected].tolist(),
+            'yaxis': 'y',
+            'type': 'scatter',
+        })
+
+    return {
+        'data': data,
+        'layout': {
+            'template': get_template(),
+            'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': 'x'}},
+            'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': 'y'}, 'ticks': 'outside', 'ticklen': 50},
+            'legend': {'title': {'text': 'color'}, 'tracegroupgap': 0, 'itemsizing': 'constant'},
+            'margin': {'l': 20, 'r': 20, 'b': 5, 't': 5},
+            'height': 700,
+        },
+    }
 
 
 def create_map_scatter_plot_fig(visits, site_and_locations):
@@ -24,48 +85,101 @@ def create_map_scatter_plot_fig(visits, site_and_locations):
         site_and_locations,
         left_index=True, right_index=True
     )
+    trips = site_location_and_prob['visits'].values
 
-    site_location_and_prob = site_location_and_prob.rename(columns={'visits': 'Trips'})
-    site_location_and_prob = site_location_and_prob.reset_index()
-
-    map_scatter_fig = px.scatter_mapbox(
-        site_location_and_prob,
-        lat='latitude', 
-        lon='longitude', 
-        color='Trips', 
-        mapbox_style='open-street-map',
-        size='Trips', 
-        hover_name='name'
-    )
-    map_scatter_fig.update_layout(margin={'l':0, 'r': 0, 't':0, 'b':0})
-
-    return map_scatter_fig
+    return {
+        'data': [{
+            'hovertemplate': '<b>%{hovertext}</b><br><br>Trips=%{marker.color}<br>latitude=%{lat}<br>longitude=%{lon}<extra></extra>',
+            'hovertext': site_location_and_prob.index.values.tolist(),
+            'lat': site_location_and_prob['latitude'].values.tolist(),
+            'legendgroup': '',
+            'lon': site_location_and_prob['longitude'].values.tolist(),
+            'marker': {'color': trips.tolist(), 'coloraxis': 'coloraxis', 'size': trips.tolist(), 'sizemode': 'area', 'sizeref': get_sizeref(trips)},
+            'mode': 'markers',
+            'name': '',
+            'showlegend': False,
+            'subplot': 'mapbox',
+            'type': 'scattermapbox',
+        }],
+        'layout': {
+            'template': get_template(),
+            'mapbox': {
+                'domain': DOMAIN,
+                'center': {'lat': site_location_and_prob['latitude'].mean(), 'lon': site_location_and_prob['longitude'].mean()},
+                'zoom': 8,
+                'style': 'open-street-map',
+            },
+            'coloraxis': {'colorbar': {'title': {'text': 'Trips'}}, 'colorscale': get_template()['layout']['colorscale']['sequential']},
+            'legend': {'tracegroupgap': 0, 'itemsizing': 'constant'},
+            'margin': {'l': 0, 'r': 0, 't': 0, 'b': 0},
+        },
+    }
 
 
 def create_equity_evaluation_fig(black, other):
-    equity_evaluation_fig = go.Figure([go.Bar(
-        x=['Black', 'Other'],
-        y=[black, other],
-    )])
-    equity_evaluation_fig.update_layout(margin={'l': 20, 'r': 20, 'b': 0, 't': 0},)
-
-    return equity_evaluation_fig
+    return {
+        'data': [{'x': ['Black', 'Other'], 'y': [float(black), float(other)], 'type': 'bar'}],
+        'layout': {'template': get_template(), 'margin': {'l': 20, 'r': 20, 'b': 0, 't': 0}},
+    }
 
 
 def create_spatial_equity_fig(bg_utility_black):
-    fig = px.choropleth_mapbox(
-        bg_utility_black, 
-        geojson=WAKE_BG_GEOJSON, 
-        locations='GEOID', 
-        color='black_utility', 
-        featureidkey='properties.GEOID',
-        color_continuous_scale="Bluered",
-        mapbox_style="carto-positron",
-        zoom=8, 
-        center={"lat": 35.7, "lon": -78.5},
-        opacity=0.8,
-    )
-    fig.update_layout(margin={"r":0,"t":0,"l":0,"b":0})
-    fig.update_traces(marker_line_width=1)
+    return {
+        'data': [{
+            'coloraxis': 'coloraxis',
+            'featureidkey': 'properties.GEOID',
+            'geojson': get_block_group_geojson_url(SPATIAL_EQUITY_ZOOM),
+            'hovertemplate': 'GEOID=%{location}<br>black_utility=%{z}<extra></extra>',
+            'locations': bg_utility_black['GEOID'].values.tolist(),
+            'marker': {'opacity': 0.8, 'line': {'width': 1}},
+            'name': '',
+            'subplot': 'mapbox',
+            'z': bg_utility_black['black_utility'].values.tolist(),
+            'type': 'choroplethmapbox',
+        }],
+        'layout': {
+            'template': get_template(),
+            'mapbox': {'domain': DOMAIN, 'center': {'lat': 35.7, 'lon': -78.5}, 'zoom': SPATIAL_EQUITY_ZOOM, 'style': 'carto-positron'},
+            'coloraxis': {'colorbar': {'title': {'text': 'black_utility'}}, 'colorscale': get_colorscale(px.colors.sequential.Bluered)},
+            'legend': {'tracegroupgap': 0},
+            'margin': {'r': 0, 't': 0, 'l': 0, 'b': 0},
+        },
+    }
+
+
+def create_site_map_fig(selected_site):
+    """
+    return map centered on the selected site, or an empty map when no site is selected
+    """
+    if selected_site is None:
+        return {
+            'data': [],
+            'layout': {
+                'template': get_template(),
+                'mapbox': {'domain': DOMAIN, 'center': {'lat': 100, 'lon': 100}, 'zoom': 8},
+                'legend': {'tracegroupgap': 0},
+                'margin': {'t': 60},
+            },
+        }
 
-    return fig
+    return {
+        'data': [{
+            'hovertemplate': '<b>%{hovertext}</b><br><br>latitude=%{lat}<br>longitude=%{lon}<extra></extra>',
+            'hovertext': [selected_site.name],
+            'lat': [selected_site.latitude],
+            'legendgroup': '',
+            'lon': [selected_site.longitude],
+            'marker': {'color': get_template()['layout']['colorway'][0]},
+            'mode': 'markers',
+            'name': '',
+            'showlegend': False,
+            'subplot': 'mapbox',
+            'type': 'scattermapbox',
+        }],
+        'layout': {
+            'template': get_template(),
+            'mapbox': {'domain': DOMAIN, 'center': {'lat': selected_site.latitude, 'lon': selected_site.longitude}, 'zoom': 14, 'style': 'open-street-map'},
+            'legend': {'tracegroupgap': 0},
+            'margin': {'l': 0, 'r': 0, 't': 0, 'b': 0},
+        },
+    }
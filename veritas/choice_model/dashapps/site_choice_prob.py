@@ -1,8 +1,12 @@
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 from django_plotly_dash import DjangoDash
 
+from choice_model.dashboard import DEFAULT_FIGURE, FIGURES, get_figure, load_scenario
+from choice_model.models import ModifiedSitesBundle
+
 
 app = DjangoDash('SiteChoiceProb', add_bootstrap_links=True)
 
@@ -20,8 +24,10 @@ app.layout = html.Div(children=[
             {'label': 'Equity Evaluation Graph', 'value': 'equity-evaluation-plot'},
             {'label': 'Spatial Equity Plot', 'value': 'spatial-equity-plot'},
         ],
-        value='bubble-plot',
+        value=DEFAULT_FIGURE,
     ),
+    # id of the bundle shown (None for the baseline), which figures of the other tabs are built for
+    dcc.Store(id='bundle-id', data=None),
     dcc.Graph(id='bubble-plot', figure=None, style=graph_style),
     dcc.Graph(id='map-scatter-plot', figure=None, style=graph_style),
     dcc.Graph(id='equity-evaluation-plot', figure=None, style=graph_style),
@@ -65,4 +71,31 @@ def display_graphs(selected_value):
 def display_graphs(selected_value):
     if 'spatial-equity-plot' == selected_value:
         return {'display': 'block'}
-    return {'display': 'none'}
\ No newline at end of file
+    return {'display': 'none'}
+
+
+def load_figure(name):
+    """
+    add callback building the figure called name (see dashboard.FIGURES) the first time its tab is selected
+    """
+    @app.callback(
+        Output(name, 'figure'),
+        Input('radio', 'value'),
+        State('bundle-id', 'data'),
+        State(name, 'figure'),
+    )
+    def update_figure(selected_value, bundle_id, figure, **kwargs):
+        if selected_value != name or figure is not None or not kwargs['user'].is_authenticated:
+            raise PreventUpdate
+
+        try:
+            baseline, counterfactual = load_scenario(kwargs['user'], bundle_id)
+        except ModifiedSitesBundle.DoesNotExist:
+            raise PreventUpdate
+
+        return get_figure(name, baseline, counterfactual)
+
+
+for name in FIGURES:
+    if name != DEFAULT_FIGURE:
+        load_figure(name)
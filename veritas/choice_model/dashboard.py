@@ -0,0 +1,85 @@
+import pandas as pd
+
+from django.conf import settings
+
+from choice_model import constants
+from choice_model.choicemodel import ChoiceModel
+from choice_model.dashapp_helpers import create_bubble_plot_fig, create_equity_evaluation_fig, create_map_scatter_plot_fig, create_spatial_equity_fig
+from choice_model.jobs import get_scenario
+from choice_model.models import ModifiedSitesBundle
+from choice_model.queries import ScenarioData
+from choice_model.timing import stage
+
+
+# the figure shown when the dashboard (the SiteChoiceProb dash app) opens, which is the only one built with the page.
+# the others are built by the dash app when their tab is first selected
+DEFAULT_FIGURE = 'bubble-plot'
+
+
+def _get_bubble_plot_fig(baseline, counterfactual):
+    # site visits for both baseline and counterfactual, combined into one dataframe
+    baseline_visits = baseline.get_site_visits()
+    counterfactual_visits = counterfactual.get_site_visits()
+    baseline_visits['type'] = 'baseline'
+    counterfactual_visits['type'] = 'counterfactual'
+
+    return create_bubble_plot_fig(pd.concat([baseline_visits, counterfactual_visits]))
+
+
+def _get_map_scatter_plot_fig(baseline, counterfactual):
+    return create_map_scatter_plot_fig(counterfactual.get_site_visits(), counterfactual.get_site_locations())
+
+
+def _get_equity_evaluation_fig(baseline, counterfactual):
+    equity_evaluation = counterfactual.get_equity_evaluation()
+
+    return create_equity_evaluation_fig(equity_evaluation['average_utility_black'], equity_evaluation['average_utility_other'])
+
+
+def _get_spatial_equity_fig(baseline, counterfactual):
+    # difference in the utility of each block group for black residents between counterfactual & baseline
+    counterfactual_bg_utility_black = counterfactual.get_block_group_utility()[['black_utility']]
+    baseline_bg_utility_black = baseline.get_block_group_utility()[['black_utility']]
+    diff_bg_utility_black = counterfactual_bg_utility_black - baseline_bg_utility_black
+    diff_bg_utility_black['GEOID'] = constants.BLOCK_GROUPS.geoids
+
+    return create_spatial_equity_fig(diff_bg_utility_black)
+
+
+# figures of the dashboard by the id of their graph in the dash app
+FIGURES = {
+    'bubble-plot': _get_bubble_plot_fig,
+    'map-scatter-plot': _get_map_scatter_plot_fig,
+    'equity-evaluation-plot': _get_equity_evaluation_fig,
+    'spatial-equity-plot': _get_spatial_equity_fig,
+}
+
+
+def get_figure(name, baseline, counterfactual):
+    """
+    return figure of the dashboard called name, comparing the counterfactual with the baseline
+    """
+    with stage('figures'):
+        return FIGURES[name](baseline, counterfactual)
+
+
+def load_scenario(user, bundle_id=None):
+    """
+    return (baseline, counterfactual) ChoiceModels of a scenario of user, where the counterfactual is the bundle with
+    bundle_id (or the baseline when it is None)
+
+    with background jobs, the models take the summaries of their finished jobs, so figures are built from the same
+    results the dashboard was opened with rather than evaluated again
+    """
+    bundle = None if bundle_id is None else ModifiedSitesBundle.objects.get(user=user, id=bundle_id)
+    data = ScenarioData.load(user, [bundle])
+    baseline = ChoiceModel(user, None, data)
+    counterfactual = baseline if bundle is None else ChoiceModel(user, bundle, data)
+
+    if settings.CHOICE_MODEL_BACKGROUND_JOBS:
+        for model in {baseline, counterfactual}:
+            status, summary = get_scenario(model)
+            if summary is not None:
+                model.summary = summary
+
+    return baseline, counterfactual
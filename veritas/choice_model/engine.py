@@ -0,0 +1,601 @@
+import threading
+
+from functools import cached_property
+
+import numpy as np
+
+
+# coefficient applied to every site -> block group distance (in miles)
+DISTANCE_COEFFICIENT = -0.011
+
+# sites at or above this many acres have their acreage scaled down before being weighted
+ACREAGE_THRESHOLD = 3000
+ACREAGE_SCALAR = 0.2
+
+# utility is clipped to this before it is exponentiated, so a site far more attractive than the rest (e.g. with a
+# huge acreage) takes nearly every trip instead of overflowing exp(utility), and its sum over sites, to infinity
+MAX_UTILITY = 600
+
+
+def get_exp_utility(utility):
+    """
+    return exp(utility) with utility clipped to MAX_UTILITY, which is always finite
+    """
+    return np.exp(np.minimum(utility, MAX_UTILITY))
+
+
+class ChoiceModelEngine():
+
+    def __init__(self, site_names, site_attributes, site_distances, true_visits, site_coefficients):
+        """
+        site_names: (S,) site names
+        site_attributes: (S, 10) site characteristics, in the column order of SITE_DATA
+        site_distances: list of (n, B) blocks of distances from each site to each block group, which
+            stacked together give (S, B). blocks are only read, so they can be memory-mapped reference rows
+        true_visits: (S,) observed visits used to calibrate the model, 0 for custom sites
+        site_coefficients: (10,) coefficient for each site characteristic
+
+        all results are dense (S, B) or (S,) arrays in the order of site_names
+        """
+        self.site_names = np.asarray(site_names)
+        self.site_attributes = np.asarray(site_attributes, dtype=float)
+        self.site_distances = [block for block in site_distances if len(block)]
+        self.true_visits = np.asarray(true_visits, dtype=float)
+        self.site_coefficients = np.asarray(site_coefficients, dtype=float).reshape(-1)
+        self._group_sites()
+
+    def _group_sites(self):
+        """
+        group duplicated site names together, needed when predicting attractiveness per site
+        """
+        _, self.site_groups, group_counts = np.unique(self.site_names, return_inverse=True, return_counts=True)
+        self.duplicated_sites = group_counts[self.site_groups] > 1
+
+    def get_site_product(self, site_attributes):
+        """
+        return (n,) weighted sum of the (n, 10) characteristics of sites
+        """
+        # scale down acreage of very large sites, without touching the caller's attributes
+        acres = site_attributes[:, 0]
+        site_attributes = site_attributes.copy()
+        site_attributes[:, 0] = acres * np.where(acres >= ACREAGE_THRESHOLD, ACREAGE_SCALAR, 1)
+
+        return site_attributes @ self.site_coefficients
+
+    def get_utility(self):
+        """
+        return (S, B) uncalibrated utility of each site for each block group
+        """
+        site_product = self.get_site_product(self.site_attributes)
+
+        # weight the distances block by block straight into the result, so no block is ever copied
+        utility = np.empty((len(self.site_names), self.site_distances[0].shape[1]))
+        start = 0
+        for block in self.site_distances:
+            np.multiply(block, DISTANCE_COEFFICIENT, out=utility[start:start + len(block)])
+            start += len(block)
+        utility += site_product[:, np.newaxis]
+
+        return utility
+
+    def get_calibration_adjuster(self, utility):
+        """
+        return (S,) adjustment that calibrates predicted attractiveness against true visits
+        """
+        predicted = utility.sum(axis=1)
+
+        # duplicated site names use the combined utility of their first block group instead
+        duplicated_predicted = np.bincount(self.site_groups, weights=utility[:, 0])[self.site_groups]
+        predicted = np.where(self.duplicated_sites, duplicated_predicted, predicted)
+
+        # closed form of regressing predicted attractiveness on true visits
+        true_visits = self.true_visits
+        true_centered = true_visits - true_visits.mean()
+        slope = (true_centered * (predicted - predicted.mean())).sum() / (true_centered ** 2).sum()
+        intercept = predicted.mean() - slope * true_visits.mean()
+
+        true_attractiveness = (true_visits - intercept) / slope
+
+        return true_attractiveness - predicted
+
+    def get_attractiveness(self):
+        """
+        return (S, B) calibrated attractiveness of each site for each block group
+        """
+        utility = self.get_utility()
+        adjuster = self.get_calibration_adjuster(utility)
+
+        return get_exp_utility(utility) + adjuster[:, np.newaxis]
+
+    def get_visitation_probability(self, attractiveness, attractiveness_sums=None):
+        """
+        return (S, B) probability of each block group visiting each site
+
+        attractiveness_sums: (B,) total attractiveness of each block group, summed from attractiveness if not given
+        """
+        if attractiveness_sums is None:
+            attractiveness_sums = attractiveness.sum(axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            visitation_probability = attractiveness / attractiveness_sums
+        visitation_probability[visitation_probability < 0] = 0
+
+        return visitation_probability
+
+    def get_utility_index(self, attractiveness):
+        """
+        return (S, B) log of attractiveness, where non-positive attractiveness counts as 1
+        """
+        return np.log(np.where(attractiveness <= 0, 1, attractiveness))
+
+    def get_visits(self, visitation_probability, population):
+        """
+        return (S,) visits to each site given a (B,) population for each block group
+        """
+        return np.nansum(visitation_probability * population, axis=1)
+
+    def get_utility_weighted_trips(self, visitation_probability, utility_index, population):
+        """
+        return (S, B) utility weighted trips for a (B,) population of a single group
+        """
+        with np.errstate(invalid='ignore'):
+            return population * visitation_probability * utility_index
+
+
+def _get_regression_statistics(true_visits, predicted):
+    """
+    return the sufficient statistics of regressing predicted attractiveness on true visits (count, sums, sum of
+    squares and cross-products), which add up over sites
+    """
+    return np.array([len(true_visits), true_visits.sum(), predicted.sum(), (true_visits ** 2).sum(), (true_visits * predicted).sum()])
+
+
+class IncrementalChoiceModelEngine(ChoiceModelEngine):
+
+    def __init__(self, site_names, site_attributes, site_distances, true_visits, site_coefficients):
+        """
+        engine for a bundle that is edited one site at a time, see ChoiceModelEngine for the arguments
+        (which hold the existing sites only, before any modified sites are applied)
+
+        exp(utility), its sum over sites for each block group and the sufficient statistics of the calibration
+        regression are kept between evaluations, so adding, changing or removing a site only recomputes the rows
+        of that site. the running sums make results differ from ChoiceModelEngine by rounding only
+
+        engines are changed in place, so callers sharing one have to hold self.lock while applying and evaluating
+        """
+        super().__init__(site_names, site_attributes, site_distances, true_visits, site_coefficients)
+        self.site_attributes = self.site_attributes.copy()
+        self.lock = threading.Lock()
+
+        # distances of every site as (B,) rows, which are views of the blocks
+        self.distance_rows = [row for block in self.site_distances for row in block]
+
+        # attributes of the existing sites, restored once their modification is removed
+        self.reference_names = set(self.site_names)
+        self.reference_attributes = self.site_attributes.copy()
+
+        utility = self.get_utility()
+        self.exp_utility = get_exp_utility(utility)
+        self.exp_utility_sums = self.exp_utility.sum(axis=0)
+        self.utility_sums = utility.sum(axis=1)
+        self.first_utility = utility[:, 0].copy()
+        self.predicted = self._get_predicted(np.arange(len(self.site_names)))
+
+        # statistics are kept around the initial means, which keeps the running sums from losing precision
+        self.shift = np.array([self.true_visits.mean(), self.predicted.mean()])
+        self.statistics = self._get_statistics(np.arange(len(self.site_names)))
+
+        # dictionary with site names as keys and the key of the edit applied to them as values, see apply()
+        self.edits = {}
+
+    def _get_predicted(self, rows):
+        """
+        return predicted attractiveness of the given rows, see ChoiceModelEngine.get_calibration_adjuster
+        """
+        group_utility = np.bincount(self.site_groups, weights=self.first_utility)
+        return np.where(self.duplicated_sites[rows], group_utility[self.site_groups[rows]], self.utility_sums[rows])
+
+    def _get_statistics(self, rows):
+        return _get_regression_statistics(self.true_visits[rows] - self.shift[0], self.predicted[rows] - self.shift[1])
+
+    def _update_rows(self, rows, site_attributes, distances=None):
+        """
+        set the attributes (and distances) of the given rows, which hold every site of one name
+        """
+        self.statistics -= self._get_statistics(rows)
+        removed = self.exp_utility[rows].sum(axis=0)
+
+        self.site_attributes[rows] = site_attributes
+        if distances is not None:
+            for row in rows:
+                self.distance_rows[row] = distances
+
+        utility = np.stack([self.distance_rows[row] for row in rows]) * DISTANCE_COEFFICIENT
+        utility = utility + self.get_site_product(self.site_attributes[rows])[:, np.newaxis]
+        self.exp_utility[rows] = get_exp_utility(utility)
+        self.utility_sums[rows] = utility.sum(axis=1)
+        self.first_utility[rows] = utility[:, 0]
+        self.predicted[rows] = self._get_predicted(rows)
+
+        self.statistics += self._get_statistics(rows)
+        self._update_exp_utility_sums(removed, self.exp_utility[rows].sum(axis=0))
+
+    def _update_exp_utility_sums(self, removed, added):
+        """
+        update the sums over sites of exp(utility) once rows summing to removed are replaced by rows summing to added
+        """
+        with np.errstate(invalid='ignore'):
+            self.exp_utility_sums += added - removed
+
+        # a sum left mostly by rows that were taken out of it (such as a site clipped to MAX_UTILITY) is mostly
+        # rounding error, so sum those block groups again from scratch
+        inexact = ~np.isfinite(self.exp_utility_sums) | (removed > self.exp_utility_sums)
+        if inexact.any():
+            self.exp_utility_sums[inexact] = self.exp_utility[:, inexact].sum(axis=0)
+
+    def _add_site(self, name, site_attributes, distances):
+        """
+        add a custom site, which has no true visits
+        """
+        self.site_names = np.append(self.site_names, np.array([name], dtype=object))
+        self.site_attributes = np.vstack([self.site_attributes, site_attributes])
+        self.true_visits = np.append(self.true_visits, 0)
+        self.distance_rows.append(distances)
+        self._group_sites()
+
+        # start from a row that adds nothing, then update it like any other row
+        self.exp_utility = np.vstack([self.exp_utility, np.zeros(self.exp_utility.shape[1])])
+        self.utility_sums = np.append(self.utility_sums, 0)
+        self.first_utility = np.append(self.first_utility, 0)
+        self.predicted = np.append(self.predicted, 0)
+        self.statistics += self._get_statistics(np.array([len(self.site_names) - 1]))
+
+        self._update_rows(np.array([len(self.site_names) - 1]), site_attributes)
+
+    def _remove_site(self, name):
+        """
+        remove a custom site
+        """
+        rows = np.flatnonzero(self.site_names == name)
+        self.statistics -= self._get_statistics(rows)
+        removed = self.exp_utility[rows].sum(axis=0)
+
+        self.site_names = np.delete(self.site_names, rows)
+        self.site_attributes = np.delete(self.site_attributes, rows, axis=0)
+        self.true_visits = np.delete(self.true_visits, rows)
+        self.distance_rows = [distances for row, distances in enumerate(self.distance_rows) if row not in rows]
+        self.exp_utility = np.delete(self.exp_utility, rows, axis=0)
+        self.utility_sums = np.delete(self.utility_sums, rows)
+        self.first_utility = np.delete(self.first_utility, rows)
+        self.predicted = np.delete(self.predicted, rows)
+        self._group_sites()
+
+        self._update_exp_utility_sums(removed, np.zeros_like(removed))
+
+    def apply(self, edits):
+        """
+        bring the sites in line with edits, a dictionary with site names as keys and (key, (10,) attributes, distances)
+        as values, where key identifies the content of the edit and distances are (B,) for custom sites, None otherwise
+
+        only sites whose edit was added, changed or removed since the last call are recomputed
+        """
+        for name in list(self.edits):
+            if name not in edits:
+                if name in self.reference_names:
+                    rows = np.flatnonzero(self.site_names == name)
+                    self._update_rows(rows, self.reference_attributes[rows])
+                else:
+                    self._remove_site(name)
+                del self.edits[name]
+
+        for name, (key, site_attributes, distances) in edits.items():
+            if self.edits.get(name) == key:
+                continue
+
+            rows = np.flatnonzero(self.site_names == name)
+            if len(rows):
+                self._update_rows(rows, site_attributes, distances)
+            else:
+                self._add_site(name, site_attributes, distances)
+            self.edits[name] = key
+
+    def get_calibration_adjuster(self, utility=None):
+        """
+        return (S,) adjustment that calibrates predicted attractiveness against true visits, from the running
+        sufficient statistics rather than utility
+        """
+        count, true_sum, predicted_sum, true_squares, cross_products = self.statistics
+        true_mean = true_sum / count
+        predicted_mean = predicted_sum / count
+        slope = (cross_products - count * true_mean * predicted_mean) / (true_squares - count * true_mean ** 2)
+        intercept = predicted_mean + self.shift[1] - slope * (true_mean + self.shift[0])
+
+        true_attractiveness = (self.true_visits - intercept) / slope
+
+        return true_attractiveness - self.predicted
+
+    def get_attractiveness(self):
+        return self.exp_utility + self.get_calibration_adjuster()[:, np.newaxis]
+
+    def get_visitation_probability(self, attractiveness, attractiveness_sums=None):
+        if attractiveness_sums is None:
+            attractiveness_sums = self.exp_utility_sums + self.get_calibration_adjuster().sum()
+
+        return super().get_visitation_probability(attractiveness, attractiveness_sums)
+
+    def get_results(self, population_black, population_other):
+        """
+        return ChoiceModelResults of the sites as they are now
+
+        results that depend on the state of the engine are evaluated right away, so later edits do not change them
+        """
+        results = ChoiceModelResults(self, population_black, population_other)
+        results.attractiveness
+        results.visitation_probability
+
+        return results
+
+
+def _read_only(values):
+    values.flags.writeable = False
+    return values
+
+
+class ChoiceModelResults():
+    """
+    results of a single engine, each evaluated on first access and then kept for the life of the object
+
+    arrays are read-only since they are shared between every caller of the same ChoiceModel
+    """
+
+    def __init__(self, engine, population_black, population_other):
+        self.engine = engine
+        self.site_names = engine.site_names
+        self.population_black = np.asarray(population_black, dtype=float)
+        self.population_other = np.asarray(population_other, dtype=float)
+
+    @cached_property
+    def attractiveness(self):
+        return _read_only(self.engine.get_attractiveness())
+
+    @cached_property
+    def utility_index(self):
+        return _read_only(self.engine.get_utility_index(self.attractiveness))
+
+    @cached_property
+    def visitation_probability(self):
+        return _read_only(self.engine.get_visitation_probability(self.attractiveness))
+
+    @cached_property
+    def visits(self):
+        population = self.population_black + self.population_other
+        return _read_only(self.engine.get_visits(self.visitation_probability, population))
+
+    @cached_property
+    def utility_weighted_trips_black(self):
+        return _read_only(self.engine.get_utility_weighted_trips(self.visitation_probability, self.utility_index, self.population_black))
+
+    @cached_property
+    def utility_weighted_trips_other(self):
+        return _read_only(self.engine.get_utility_weighted_trips(self.visitation_probability, self.utility_index, self.population_other))
+
+    @cached_property
+    def block_group_utility_black(self):
+        return _read_only(np.nansum(self.utility_weighted_trips_black, axis=0))
+
+    @cached_property
+    def block_group_utility_other(self):
+        return _read_only(np.nansum(self.utility_weighted_trips_other, axis=0))
+
+    @cached_property
+    def equity_evaluation(self):
+        """
+        return equity evaluations for black and non-black groups
+        """
+        return get_equity_evaluation(
+            self.block_group_utility_black, self.block_group_utility_other, self.population_black, self.population_other,
+        )
+
+
+def get_equity_evaluation(block_group_utility_black, block_group_utility_other, population_black, population_other):
+    """
+    return equity evaluations for black and non-black groups from their utility in each block group
+
+    block group utilities can have leading (scenario) dimensions, the ratios then have the same leading dimensions
+    """
+    # Average Utility by Equity Group
+    average_utility_black = block_group_utility_black.sum(axis=-1) / population_black.sum()
+    average_utility_other = block_group_utility_other.sum(axis=-1) / population_other.sum()
+
+    # Exponentiate and find ratio, as exp(a) / (exp(a) + exp(b)) = 1 / (1 + exp(b - a)), which only overflows (to a
+    # ratio of 0) once the other group's average utility is hundreds above this one's
+    with np.errstate(over='ignore'):
+        exp_ratio_black = 1 / (1 + np.exp(average_utility_other - average_utility_black))
+        exp_ratio_other = 1 / (1 + np.exp(average_utility_black - average_utility_other))
+
+    return {
+        'average_utility_black': exp_ratio_black,
+        'average_utility_other': exp_ratio_other,
+    }
+
+
+class ChoiceModelSummary():
+    """
+    the subset of results shown on the dashboard, small enough to keep in a cache
+    """
+
+    def __init__(self, site_names, visits, equity_evaluation, block_group_utility_black, block_group_utility_other, custom_site_locations):
+        self.site_names = site_names
+        self.visits = visits
+        self.equity_evaluation = equity_evaluation
+        self.block_group_utility_black = block_group_utility_black
+        self.block_group_utility_other = block_group_utility_other
+        self.custom_site_locations = custom_site_locations
+
+    @classmethod
+    def from_results(cls, results, custom_site_locations=None):
+        """
+        custom_site_locations: dictionary with custom site names as keys and [lat, lon] as values
+        """
+        return cls(
+            site_names=results.site_names,
+            visits=results.visits,
+            equity_evaluation=results.equity_evaluation,
+            block_group_utility_black=results.block_group_utility_black,
+            block_group_utility_other=results.block_group_utility_other,
+            custom_site_locations=custom_site_locations or {},
+        )
+
+
+class ChoiceModelBatchEngine():
+
+    def __init__(self, site_names, site_attributes, site_distances, true_visits, site_coefficients, custom_sites):
+        """
+        evaluate N scenarios that share the same existing sites and baseline calibration together
+
+        site_names: (R,) names of the existing sites
+        site_attributes: (N, R, 10) characteristics of the existing sites in each scenario
+        site_distances: (R, B) distances from each existing site to each block group
+        true_visits: (R,) observed visits of the existing sites
+        site_coefficients: (10,) coefficient for each site characteristic
+        custom_sites: list of N (names, (C, 10) attributes, (C, B) distances) of the sites added in each scenario
+
+        custom sites are stacked after the existing sites and padded to the largest scenario, so every result
+        is a dense (N, S, B), (N, S) or (N, B) array. self.mask marks which of the S rows are real sites
+        """
+        self.site_names = np.asarray(site_names)
+        self.site_attributes = np.asarray(site_attributes, dtype=float)
+        self.site_distances = site_distances
+        self.true_visits = np.asarray(true_visits, dtype=float)
+        self.site_coefficients = np.asarray(site_coefficients, dtype=float).reshape(-1)
+        self.custom_sites = custom_sites
+
+        scenarios, sites = self.site_attributes.shape[:2]
+        custom_counts = np.array([len(names) for names, _, _ in custom_sites], dtype=int)
+        self.shape = (scenarios, sites + custom_counts.max(initial=0), site_distances.shape[1])
+        self.mask = np.arange(self.shape[1]) < (sites + custom_counts)[:, np.newaxis]
+
+        # group duplicated site names together, needed when predicting attractiveness per site
+        _, self.site_groups, group_counts = np.unique(self.site_names, return_inverse=True, return_counts=True)
+        self.duplicated_sites = group_counts[self.site_groups] > 1
+
+    def get_utility(self):
+        """
+        return (N, S, B) uncalibrated utility of each site for each block group in each scenario
+        """
+        scenarios, sites = self.site_attributes.shape[:2]
+
+        # existing and custom sites of every scenario stacked together, with padding rows of zeros
+        site_attributes = np.zeros(self.shape[:2] + (len(self.site_coefficients),))
+        site_attributes[:, :sites] = self.site_attributes
+        utility = np.zeros(self.shape)
+        utility[:, :sites] = np.asarray(self.site_distances) * DISTANCE_COEFFICIENT
+        for scenario, (_, custom_attributes, custom_distances) in enumerate(self.custom_sites):
+            site_attributes[scenario, sites:sites + len(custom_attributes)] = custom_attributes
+            utility[scenario, sites:sites + len(custom_distances)] = np.asarray(custom_distances) * DISTANCE_COEFFICIENT
+
+        # scale down acreage of very large sites
+        acres = site_attributes[..., 0]
+        site_attributes[..., 0] = acres * np.where(acres >= ACREAGE_THRESHOLD, ACREAGE_SCALAR, 1)
+
+        utility += (site_attributes @ self.site_coefficients)[..., np.newaxis]
+
+        return utility
+
+    def get_calibration_adjuster(self, utility):
+        """
+        return (N, S) adjustment that calibrates predicted attractiveness against true visits, see ChoiceModelEngine
+        """
+        sites = len(self.site_names)
+        predicted = utility.sum(axis=-1)
+
+        # duplicated site names use the combined utility of their first block group instead
+        group_utility = np.zeros((self.shape[0], self.site_groups.max() + 1))
+        np.add.at(group_utility, (slice(None), self.site_groups), utility[:, :sites, 0])
+        predicted[:, :sites] = np.where(self.duplicated_sites, group_utility[:, self.site_groups], predicted[:, :sites])
+
+        # custom sites have no true visits
+        true_visits = np.zeros(self.shape[:2])
+        true_visits[:, :sites] = self.true_visits
+
+        # closed form of regressing predicted attractiveness on true visits, over the real sites of each scenario
+        counts = self.mask.sum(axis=1, keepdims=True)
+        true_mean = np.where(self.mask, true_visits, 0).sum(axis=1, keepdims=True) / counts
+        predicted_mean = np.where(self.mask, predicted, 0).sum(axis=1, keepdims=True) / counts
+        true_centered = np.where(self.mask, true_visits - true_mean, 0)
+        slope = (true_centered * (predicted - predicted_mean)).sum(axis=1, keepdims=True) / (true_centered ** 2).sum(axis=1, keepdims=True)
+        intercept = predicted_mean - slope * true_mean
+
+        true_attractiveness = (true_visits - intercept) / slope
+
+        return np.where(self.mask, true_attractiveness - predicted, 0)
+
+    def get_attractiveness(self):
+        """
+        return (N, S, B) calibrated attractiveness, 0 for padding rows
+        """
+        utility = self.get_utility()
+        adjuster = self.get_calibration_adjuster(utility)
+
+        attractiveness = get_exp_utility(utility) + adjuster[..., np.newaxis]
+        attractiveness[~self.mask] = 0
+
+        return attractiveness
+
+    def get_visitation_probability(self, attractiveness):
+        """
+        return (N, S, B) probability of each block group visiting each site, 0 for padding rows
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            visitation_probability = attractiveness / attractiveness.sum(axis=1, keepdims=True)
+        visitation_probability[visitation_probability < 0] = 0
+        visitation_probability[~self.mask] = 0
+
+        return visitation_probability
+
+    def evaluate(self, population_black, population_other):
+        """
+        return dictionary of (N, S) visits, (N, B) block group utility of black and other groups and (N,) equity ratios
+        """
+        attractiveness = self.get_attractiveness()
+        visitation_probability = self.get_visitation_probability(attractiveness)
+
+        utility_index = np.log(np.where(attractiveness <= 0, 1, attractiveness))
+        del attractiveness
+
+        visits = np.nansum(visitation_probability * (population_black + population_other), axis=-1)
+        with np.errstate(invalid='ignore'):
+            block_group_utility_black = np.nansum(population_black * visitation_probability * utility_index, axis=1)
+            block_group_utility_other = np.nansum(population_other * visitation_probability * utility_index, axis=1)
+
+        return {
+            'visits': visits,
+            'block_group_utility_black': block_group_utility_black,
+            'block_group_utility_other': block_group_utility_other,
+            **get_equity_evaluation(block_group_utility_black, block_group_utility_other, population_black, population_other),
+        }
+
+    def get_summaries(self, population_black, population_other, custom_site_locations):
+        """
+        return list of N ChoiceModelSummary, one for each scenario
+        """
+        population_black = np.asarray(population_black, dtype=float)
+        population_other = np.asarray(population_other, dtype=float)
+        results = self.evaluate(population_black, population_other)
+
+        summaries = []
+        for scenario, (custom_names, _, _) in enumerate(self.custom_sites):
+            sites = self.mask[scenario].sum()
+            summaries.append(ChoiceModelSummary(
+                site_names=np.concatenate([self.site_names, np.asarray(custom_names, dtype=object)]),
+                visits=results['visits'][scenario, :sites],
+                equity_evaluation={
+                    'average_utility_black': results['average_utility_black'][scenario],
+                    'average_utility_other': results['average_utility_other'][scenario],
+                },
+                block_group_utility_black=results['block_group_utility_black'][scenario],
+                block_group_utility_other=results['block_group_utility_other'][scenario],
+                custom_site_locations=custom_site_locations[scenario],
+            ))
+
+        return summaries
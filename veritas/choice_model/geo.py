@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import warnings
+
+import numpy as np
+
+from django.urls import reverse
+from shapely.errors import ShapelyDeprecationWarning
+from shapely.geometry import Point, mapping, shape
+from shapely.strtree import STRtree
+
+from choice_model import constants
+
+
+# mean radius of the earth in meters, same as the one used by h3.point_dist
+EARTH_RADIUS = 6371007.180918475
+
+MILES_PER_METER = 0.000621371
+
+# versions of the block group shapes served to figures, as (simplification tolerance in degrees, decimals kept in
+# coordinates), from finest to coarsest
+RESOLUTIONS = {
+    'full': (0, 6),
+    'high': (0.0001, 5),
+    'medium': (0.0005, 4),
+    'low': (0.002, 3),
+}
+
+# size of the tiles of mapbox maps in pixels, which cover 360 / 2 ** zoom degrees of longitude
+TILE_SIZE = 512
+
+
+def get_distances_in_miles(latitudes, longitudes, coordinates):
+    """
+    return (N, B) great-circle (haversine) distance in miles between N points and B (lat, lon) coordinates
+    """
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))[:, np.newaxis]
+    longitudes = np.radians(np.asarray(longitudes, dtype=float))[:, np.newaxis]
+    coordinate_latitudes, coordinate_longitudes = np.radians(np.asarray(coordinates, dtype=float)).T
+
+    haversine = (
+        np.sin((coordinate_latitudes - latitudes) / 2) ** 2
+        + np.cos(latitudes) * np.cos(coordinate_latitudes) * np.sin((coordinate_longitudes - longitudes) / 2) ** 2
+    )
+    distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(haversine))
+
+    return distances * MILES_PER_METER
+
+
+def get_block_group_distances(latitude, longitude):
+    """
+    return (B,) float32 distance in miles between a single point and every block group, in the column order of DISTANCES
+    """
+    return get_distances_in_miles([latitude], [longitude], constants.BLOCK_GROUP_COORDINATES)[0].astype(np.float32)
+
+
+def get_geoid(label):
+    """
+    return GEOID of a block group, as used by the features of WAKE_BG_GEOJSON, from its label in DISTANCES and
+    POPULATION, e.g. '50100, 1, 35.781011, -78.634348' -> '501001'
+    """
+    return label.replace(', ', '')[:6]
+
+
+class BlockGroups():
+    """
+    registry of the block groups of the model, built once from the reference data (see constants.BLOCK_GROUPS)
+
+    maps the GEOID of every block group to its position (its column in DISTANCES and its row in POPULATION) and
+    its coordinates, and keeps a spatial index over the shapes of the block groups for locating points
+    """
+
+    def __init__(self, labels, coordinates, features=()):
+        """
+        labels & coordinates are in the column order of DISTANCES, features are the geojson features of the shapes
+        (features of block groups outside the model are left out)
+        """
+        self.geoids = np.array([get_geoid(label) for label in labels], dtype=object)
+        self.coordinates = np.asarray(coordinates, dtype=float)
+
+        # repeated GEOIDs (only found in synthetic benchmark data) refer to their first block group
+        self._positions = {}
+        for position, geoid in enumerate(self.geoids):
+            self._positions.setdefault(geoid, position)
+
+        self._interior_points = {}
+        self._shapes = []
+        self._shape_geoids = []
+        for feature in features:
+            properties = feature['properties']
+            if properties['GEOID'] not in self._positions:
+                continue
+
+            if 'INTPTLAT' in properties and 'INTPTLON' in properties:
+                self._interior_points[properties['GEOID']] = (float(properties['INTPTLAT']), float(properties['INTPTLON']))
+            if feature.get('geometry'):
+                self._shapes.append(shape(feature['geometry']))
+                self._shape_geoids.append(properties['GEOID'])
+
+        # the item queries used below are those of the pinned Shapely 1.8, which warns about the 2.0 api on creation
+        self._tree = None
+        if self._shapes:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', ShapelyDeprecationWarning)
+                self._tree = STRtree(self._shapes)
+
+    def __len__(self):
+        return len(self.geoids)
+
+    def __contains__(self, geoid):
+        return geoid in self._positions
+
+    def get_position(self, geoid):
+        """
+        return column of the block group in DISTANCES, which is also its row in POPULATION (KeyError if unknown)
+        """
+        return self._positions[geoid]
+
+    def get_location(self, geoid):
+        """
+        return (lat, lon) of a point of the block group, its interior point from the geojson when there is one
+        """
+        if geoid in self._interior_points:
+            return self._interior_points[geoid]
+
+        latitude, longitude = self.coordinates[self.get_position(geoid)]
+        return float(latitude), float(longitude)
+
+    def locate(self, latitude, longitude):
+        """
+        return GEOID of the block group containing the point, or None if the point is outside every block group
+        """
+        if self._tree is None:
+            return None
+
+        point = Point(longitude, latitude)
+        for item in self._tree.query_items(point):
+            if self._shapes[item].covers(point):
+                return self._shape_geoids[item]
+
+        return None
+
+    def nearest(self, latitude, longitude):
+        """
+        return GEOID of the block group closest to the point (by shape, or by coordinates when there are no shapes)
+        """
+        if self._tree is None:
+            return self.geoids[np.argmin(get_distances_in_miles([latitude], [longitude], self.coordinates)[0])]
+
+        return self._shape_geoids[self._tree.nearest_item(Point(longitude, latitude))]
+
+
+def get_resolution(zoom):
+    """
+    return the coarsest of RESOLUTIONS that is simplified by no more than a pixel at zoom
+    """
+    pixel = 360 / (TILE_SIZE * 2 ** zoom)
+
+    return max(
+        (name for name, (tolerance, decimals) in RESOLUTIONS.items() if tolerance <= pixel),
+        key=lambda name: RESOLUTIONS[name][0],
+    )
+
+
+def get_block_group_geojson_url(zoom=None):
+    """
+    return url of the current version of the block group geojson, at the resolution fit for maps at zoom (full
+    resolution when zoom is None), which figures load their shapes from
+    """
+    resolution = 'full' if zoom is None else get_resolution(zoom)
+    asset = constants.BLOCK_GROUP_GEOJSON[resolution]
+
+    return reverse('block-group-geojson', kwargs={'resolution': resolution, 'version': asset.version})
+
+
+def round_coordinates(coordinates, decimals):
+    """
+    return nested geojson coordinates rounded to decimals, which keeps the serialized geometry short
+    """
+    if isinstance(coordinates[0], (int, float)):
+        return [round(coordinate, decimals) for coordinate in coordinates]
+    return [round_coordinates(part, decimals) for part in coordinates]
+
+
+def simplify_features(features, tolerance, decimals):
+    """
+    return geojson features with their geometry simplified to tolerance (keeping every shape valid) and rounded
+    to decimals, and only the GEOID left of their properties
+    """
+    simplified = []
+    for feature in features:
+        geometry = shape(feature['geometry'])
+        if tolerance:
+            geometry = geometry.simplify(tolerance, preserve_topology=True)
+        geometry = mapping(geometry)
+
+        simplified.append({
+            'type': 'Feature',
+            'properties': {'GEOID': feature['properties']['GEOID']},
+            'geometry': {'type': geometry['type'], 'coordinates': round_coordinates(geometry['coordinates'], decimals)},
+        })
+
+    return simplified
+
+
+def build_geometries(source_path, store_path, block_groups):
+    """
+    simplify the shapes of the block groups in the geojson at source_path at every one of RESOLUTIONS, writing
+    them to <resolution>.json files in a directory of store_path
+
+    return the directory, which is named by the fingerprint of the geojson, block groups and resolutions so the
+    shapes are never simplified twice for the same input
+    """
+    source = source_path.read_bytes()
+
+    fingerprint = hashlib.sha1(source)
+    fingerprint.update(json.dumps(RESOLUTIONS).encode())
+    fingerprint.update(','.join(block_groups.geoids).encode())
+
+    path = store_path / f'geometries-{fingerprint.hexdigest()}'
+    if all((path / f'{resolution}.json').exists() for resolution in RESOLUTIONS):
+        return path
+
+    # only the block groups of the model are drawn
+    features = [feature for feature in json.loads(source)['features'] if feature['properties']['GEOID'] in block_groups]
+
+    # build in a temporary directory so other processes never see partially written geometries
+    temporary_path = store_path / f'{path.name}.tmp-{os.getpid()}'
+    temporary_path.mkdir(parents=True, exist_ok=True)
+
+    for resolution, (tolerance, decimals) in RESOLUTIONS.items():
+        geojson = {'type': 'FeatureCollection', 'features': simplify_features(features, tolerance, decimals)}
+        with open(temporary_path / f'{resolution}.json', 'w') as f:
+            json.dump(geojson, f, separators=(',', ':'))
+
+    try:
+        temporary_path.rename(path)
+    except OSError:
+        # another process finished building the same geometries first
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+    return path
+
+
+def load_geometries(source_path, store_path, block_groups):
+    """
+    return dictionary with every one of RESOLUTIONS as keys and the GeoJSONAsset of the shapes at that resolution as values
+    """
+    path = build_geometries(source_path, store_path, block_groups)
+
+    return {resolution: GeoJSONAsset((path / f'{resolution}.json').read_bytes()) for resolution in RESOLUTIONS}
+
+
+class GeoJSONAsset():
+    """
+    geojson of the block groups, compressed once, which is served from a url versioned by its contents (see
+    views/geo.py) so browsers cache it for good and figures only refer to it by url
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.compressed = gzip.compress(content, mtime=0)
+        self.version = hashlib.sha1(content).hexdigest()[:12]
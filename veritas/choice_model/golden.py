@@ -0,0 +1,296 @@
+import numpy as np
+
+from authentication.models import CustomUser
+from choice_model import constants
+from choice_model.choicemodel import ChoiceModel
+from choice_model.engine import ChoiceModelResults
+from choice_model.models import BaselineModel, BaselineSite, ModifiedSite, ModifiedSitesBundle
+from choice_model.pandas_model import PandasChoiceModel
+
+
+# outputs of every fixture scenario, as evaluated by the reference (see evaluate_reference) when the file was last
+# updated (manage.py check_golden_outputs --update)
+GOLDEN_OUTPUTS_PATH = constants.CURRENT_PATH / 'golden_outputs.npz'
+
+DEFAULT_RTOL = 1e-9
+DEFAULT_ATOL = 1e-9
+
+# visitation probabilities are kept as projections of their rows and columns on these seeds' random weights,
+# which change along with any single probability but only take (sites + block groups) values instead of their product
+SITE_PROJECTION_SEED = 0
+BLOCK_GROUP_PROJECTION_SEED = 1
+
+
+def _create_bundle(user, nickname, modified_sites):
+    bundle = ModifiedSitesBundle.objects.create(user=user, nickname=nickname)
+    for modified_site in modified_sites:
+        ModifiedSite.objects.create(
+            bundle=bundle,
+            **{
+                'latitude': 35.8,
+                'longitude': -78.6,
+                'acres': 100,
+                'trails': 1,
+                'trail_miles': 2,
+                'picnic_area': 1,
+                'sports_facilities': 0,
+                'swimming_facilities': 0,
+                'boat_launch': 0,
+                'waterbody': 0,
+                'bathrooms': 1,
+                'playgrounds': 0,
+                **modified_site,
+            },
+        )
+
+    return bundle
+
+
+def _create_baseline(user):
+    baseline_model = BaselineModel.objects.create(user=user, name='golden baseline')
+    BaselineSite.objects.bulk_create([
+        BaselineSite(baseline_model=baseline_model, name=name, visits=visits * (1 + 0.25 * (i % 4)))
+        for i, (name, visits) in enumerate(constants.BASELINE_VISITS['visits'].items())
+    ])
+
+
+def baseline(user):
+    return None
+
+
+def custom_baseline(user):
+    _create_baseline(user)
+    return None
+
+
+def modified_existing_sites(user):
+    return _create_bundle(user, 'modified existing sites', [
+        {'name': constants.SITE_DATA.index[0], 'acres': 250, 'trails': 1, 'trail_miles': 5},
+        {'name': constants.SITE_DATA.index[100], 'acres': 4000, 'boat_launch': 1, 'waterbody': 1},
+
+        # a name shared by several existing sites
+        {'name': 'Lions Park', 'acres': 60, 'playgrounds': 1},
+    ])
+
+
+def custom_sites(user):
+    return _create_bundle(user, 'custom sites', [
+        {'name': 'Golden Site 1', 'latitude': 35.78, 'longitude': -78.64, 'acres': 80},
+        {'name': 'Golden Site 2', 'latitude': 35.95, 'longitude': -78.55, 'acres': 3500, 'trail_miles': 12},
+        {'name': 'Golden Site 3', 'latitude': 35.66, 'longitude': -78.85, 'acres': 15, 'swimming_facilities': 1},
+    ])
+
+
+def custom_sites_with_custom_baseline(user):
+    _create_baseline(user)
+    return custom_sites(user)
+
+
+def infinite_attractiveness(user):
+    # big enough for exp(utility) to overflow to infinity unless utility is clipped (see engine.MAX_UTILITY)
+    return _create_bundle(user, 'infinite attractiveness', [
+        {'name': 'Golden Site 1', 'latitude': 35.78, 'longitude': -78.64, 'acres': 400000},
+    ])
+
+
+SCENARIOS = {
+    scenario.__name__: scenario
+    for scenario in [baseline, custom_baseline, modified_existing_sites, custom_sites, custom_sites_with_custom_baseline, infinite_attractiveness]
+}
+
+
+def _get_population():
+    return constants.POPULATION['Black'].values, constants.POPULATION['Other'].values
+
+
+def get_outputs(site_names, visits, equity_evaluation, block_group_utility_black, block_group_utility_other, visitation_probability=None):
+    """
+    return dictionary of the outputs compared between engines
+    """
+    outputs = {
+        'site_names': np.asarray(site_names, dtype=str),
+        'visits': np.asarray(visits, dtype=float),
+        'equity_evaluation': np.array([equity_evaluation['average_utility_black'], equity_evaluation['average_utility_other']], dtype=float),
+        'block_group_utility_black': np.asarray(block_group_utility_black, dtype=float),
+        'block_group_utility_other': np.asarray(block_group_utility_other, dtype=float),
+    }
+
+    if visitation_probability is not None:
+        sites, block_groups = visitation_probability.shape
+        outputs['site_probability'] = visitation_probability @ np.random.default_rng(SITE_PROJECTION_SEED).random(block_groups)
+        outputs['block_group_probability'] = np.random.default_rng(BLOCK_GROUP_PROJECTION_SEED).random(sites) @ visitation_probability
+
+    return outputs
+
+
+def _get_results_outputs(results):
+    return get_outputs(
+        results.site_names, results.visits, results.equity_evaluation,
+        results.block_group_utility_black, results.block_group_utility_other, results.visitation_probability,
+    )
+
+
+def evaluate_full(user, bundle):
+    """
+    evaluate every site from scratch with ChoiceModelEngine
+    """
+    model = ChoiceModel(user, bundle)
+    return _get_results_outputs(ChoiceModelResults(model._get_engine(), *_get_population()))
+
+
+def evaluate_incremental(user, bundle):
+    """
+    evaluate with IncrementalChoiceModelEngine, applying the modified sites in two steps
+    """
+    model = ChoiceModel(user, bundle)
+    engine = model._build_incremental_engine()
+
+    edits = model._get_edits()
+    engine.apply(dict(list(edits.items())[:len(edits) // 2]))
+    engine.apply(edits)
+
+    return _get_results_outputs(engine.get_results(*_get_population()))
+
+
+def evaluate_batch(user, bundle):
+    """
+    evaluate with ChoiceModel.evaluate_many, which does not keep visitation probabilities
+    """
+    summary = ChoiceModel.evaluate_many(user, [None, bundle])[1]
+    return get_outputs(
+        summary.site_names, summary.visits, summary.equity_evaluation,
+        summary.block_group_utility_black, summary.block_group_utility_other,
+    )
+
+
+ENGINES = {
+    'full': evaluate_full,
+    'incremental': evaluate_incremental,
+    'batch': evaluate_batch,
+}
+
+
+def _get_positions(names, ordered_names):
+    """
+    return positions in names of every name in ordered_names, where duplicated names are taken in the order they appear
+    """
+    positions = {}
+    for position, name in enumerate(names):
+        positions.setdefault(name, []).append(position)
+
+    return np.array([positions[name].pop(0) for name in ordered_names])
+
+
+def evaluate_reference(user, bundle):
+    """
+    evaluate with PandasChoiceModel, the pandas model the engines replaced, which is what the golden outputs are
+    generated from so the engines are never checked against their own results
+    """
+    model = PandasChoiceModel(user, bundle)
+    visits = model.get_site_visits()['visits']
+    utility_weighted_trips_black, utility_weighted_trips_other = model.get_utility_by_block_group()
+
+    # sites of the reference are sorted by name, the engines keep existing sites followed by custom sites
+    custom_names = [site.name for site in model.modified_sites if site.name not in constants.SITE_DATA.index]
+    site_names = [*constants.SITE_DATA.index, *dict.fromkeys(custom_names)]
+    positions = _get_positions(visits.index, site_names)
+
+    return get_outputs(
+        site_names, visits.values[positions], model.get_equity_evaluation(),
+        utility_weighted_trips_black.sum().values, utility_weighted_trips_other.sum().values,
+        model.get_site_visitation_probability().values[positions],
+    )
+
+
+# evaluates the scenarios for the golden outputs, along with ENGINES
+REFERENCE = 'reference'
+EVALUATORS = {REFERENCE: evaluate_reference, **ENGINES}
+
+
+def evaluate_scenarios(engine):
+    """
+    return dictionary with scenario names as keys and their outputs evaluated by engine (REFERENCE or a key of ENGINES)
+    as values
+
+    every scenario is set up for a new user, so this has to run in a database that can be thrown away
+    """
+    outputs = {}
+    for name, scenario in SCENARIOS.items():
+        user = CustomUser.objects.create_user(f'{name}@golden.test', 'golden')
+        outputs[name] = EVALUATORS[engine](user, scenario(user))
+
+    return outputs
+
+
+def save(outputs, path=GOLDEN_OUTPUTS_PATH):
+    arrays = {'block_groups': np.asarray(constants.POPULATION.index, dtype=str)}
+    for scenario, scenario_outputs in outputs.items():
+        for name, values in scenario_outputs.items():
+            if values.dtype.kind == 'f' and not np.isfinite(values).all():
+                raise ValueError(f'{scenario}: {name} is not finite')
+            arrays[f'{scenario}/{name}'] = values
+
+    np.savez_compressed(path, **arrays)
+
+
+def load(path=GOLDEN_OUTPUTS_PATH):
+    """
+    return block group labels and dictionary of golden outputs, in the format of evaluate_scenarios
+    """
+    with np.load(path) as arrays:
+        outputs = {}
+        for key in arrays.files:
+            if key != 'block_groups':
+                scenario, name = key.split('/')
+                outputs.setdefault(scenario, {})[name] = arrays[key]
+
+        return arrays['block_groups'], outputs
+
+
+def compare(outputs, golden_outputs, block_groups, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL, limit=5):
+    """
+    return list of lines reporting every output that is not finite or differs from golden_outputs beyond the tolerances
+    (see np.isclose), empty when all of them match. outputs per site or block group list their worst limit differences
+    """
+    report = []
+    for scenario, golden in golden_outputs.items():
+        scenario_outputs = outputs.get(scenario, {})
+        golden_names = golden['site_names']
+
+        if 'site_names' in scenario_outputs and not np.array_equal(scenario_outputs['site_names'], golden_names):
+            report.append(f'{scenario}: sites differ, {list(scenario_outputs["site_names"])} instead of {list(golden_names)}')
+            continue
+
+        # engines that do not produce an output are not compared on it
+        for name in golden:
+            if name == 'site_names' or name not in scenario_outputs:
+                continue
+
+            expected = golden[name]
+            actual = scenario_outputs[name]
+            if actual.shape != expected.shape:
+                report.append(f'{scenario}: {name} has shape {actual.shape} instead of {expected.shape}')
+                continue
+
+            labels = golden_names if len(expected) == len(golden_names) else block_groups
+            if name == 'equity_evaluation':
+                labels = ['black', 'other']
+
+            # every output of the model is finite, so NaN or infinity never counts as matching
+            infinite = ~np.isfinite(actual)
+            if infinite.any():
+                report.append(f'{scenario}: {name} is not finite in {infinite.sum()} of {len(actual)} values')
+                for i in np.flatnonzero(infinite)[:limit]:
+                    report.append(f'    {labels[i]}: {actual[i]!r}')
+                continue
+
+            mismatched = ~np.isclose(actual, expected, rtol=rtol, atol=atol)
+            if not mismatched.any():
+                continue
+
+            difference = np.where(mismatched, np.abs(actual - expected), 0)
+            report.append(f'{scenario}: {name} differs in {mismatched.sum()} of {len(expected)} values')
+            for i in np.argsort(-difference)[:min(limit, mismatched.sum())]:
+                report.append(f'    {labels[i]}: {actual[i]!r} instead of {expected[i]!r}')
+
+    return report
@@ -0,0 +1,206 @@
+import pickle
+import threading
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from choice_model.cache import get_bundle_hash
+from choice_model.models import ModifiedSitesBundle, ScenarioJob
+
+
+# threads running jobs inside web processes, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.CHOICE_MODEL_JOB_THREADS, thread_name_prefix='scenario-job')
+        return _executor
+
+
+def _run_in_thread():
+    try:
+        run_pending_jobs()
+    finally:
+        connections.close_all()
+
+
+def enqueue(user, bundle=None):
+    """
+    queue the evaluation of a scenario (bundle of None meaning the baseline of user), unless it is already waiting,
+    and start running it once the current transaction is committed
+    """
+    if not ScenarioJob.objects.filter(user=user, bundle=bundle, status=ScenarioJob.PENDING).exists():
+        ScenarioJob.objects.create(user=user, bundle=bundle)
+
+    if settings.CHOICE_MODEL_JOB_THREADS:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread))
+
+
+def enqueue_bundle(bundle_id):
+    """
+    queue the evaluation of a bundle once the current transaction is committed, if the bundle still exists then
+    """
+    def enqueue_if_exists():
+        bundle = ModifiedSitesBundle.objects.filter(id=bundle_id).select_related('user').first()
+        if bundle is not None:
+            enqueue(bundle.user, bundle)
+
+    if settings.CHOICE_MODEL_BACKGROUND_JOBS:
+        transaction.on_commit(enqueue_if_exists)
+
+
+def claim_job():
+    """
+    return the oldest pending job after marking it as running, or None when there is none
+    """
+    for job in ScenarioJob.objects.filter(status=ScenarioJob.PENDING).select_related('user', 'bundle').defer('summary').order_by('created')[:10]:
+        # only one worker gets to update the status of a pending job
+        started = timezone.now()
+        if ScenarioJob.objects.filter(id=job.id, status=ScenarioJob.PENDING).update(status=ScenarioJob.RUNNING, started=started):
+            job.status = ScenarioJob.RUNNING
+            job.started = started
+            return job
+
+    return None
+
+
+def run_job(job):
+    """
+    evaluate the scenario of a running job, storing its summary (or error) with the job
+    """
+    from choice_model.choicemodel import ChoiceModel
+
+    fields = {}
+    try:
+        model = ChoiceModel(job.user, job.bundle)
+        fields['baseline_hash'] = model.baseline_hash
+        fields['bundle_hash'] = _get_bundle_hash(model)
+        fields['summary'] = pickle.dumps(model.summary)
+        fields['status'] = ScenarioJob.DONE
+    except Exception:
+        fields['status'] = ScenarioJob.FAILED
+        fields['error'] = traceback.format_exc()
+    fields['finished'] = timezone.now()
+
+    # the job is gone if its bundle was deleted in the meantime, so update rather than save
+    ScenarioJob.objects.filter(id=job.id).update(**fields)
+
+    # earlier results of the scenario are superseded
+    ScenarioJob.objects.filter(
+        user=job.user_id, bundle=job.bundle_id, status__in=[ScenarioJob.DONE, ScenarioJob.FAILED], created__lt=job.created,
+    ).delete()
+
+
+def run_pending_jobs():
+    """
+    run pending jobs until there are none left, return how many were run
+    """
+    count = 0
+    while (job := claim_job()) is not None:
+        run_job(job)
+        count += 1
+
+    return count
+
+
+def _get_bundle_hash(model):
+    return '' if model.bundle is None else get_bundle_hash(model.modified_sites)
+
+
+def get_scenario_hashes(model):
+    """
+    return (baseline hash, bundle hash) of a ChoiceModel, which jobs store as the content they were evaluated from
+    """
+    return model.baseline_hash, _get_bundle_hash(model)
+
+
+# status of a scenario whose latest job is out of date, lost or due to be retried, so it needs a new job (which
+# get_scenario queues)
+STALE = 'stale'
+
+
+def _is_retry_due(job, get_hashes):
+    """
+    whether a failed job is to be run again, which is once CHOICE_MODEL_JOB_RETRY_DELAY has passed since it failed (in
+    case the failure was transient) or right away once its scenario changed
+    """
+    # jobs failing before the model was built do not know which content they were evaluated from
+    if job.baseline_hash and (job.baseline_hash, job.bundle_hash) != get_hashes():
+        return True
+
+    return job.finished is None or job.finished <= timezone.now() - timedelta(seconds=settings.CHOICE_MODEL_JOB_RETRY_DELAY)
+
+
+def _get_job_status(job, get_hashes):
+    """
+    return status of the scenario given its latest job (or None), STALE when it needs a new one
+
+    get_hashes() returns the current hashes of the scenario (see get_scenario_hashes), only called once the job is
+    done or failed
+    """
+    if job is None:
+        return STALE
+
+    if job.status == ScenarioJob.PENDING:
+        return job.status
+
+    if job.status == ScenarioJob.RUNNING:
+        # jobs running for longer than CHOICE_MODEL_JOB_TIMEOUT are taken as lost
+        if job.started > timezone.now() - timedelta(seconds=settings.CHOICE_MODEL_JOB_TIMEOUT):
+            return job.status
+        return STALE
+
+    if job.status == ScenarioJob.FAILED:
+        return STALE if _is_retry_due(job, get_hashes) else job.status
+
+    return job.status if (job.baseline_hash, job.bundle_hash) == get_hashes() else STALE
+
+
+def _get_latest_job(user, bundle):
+    return (
+        ScenarioJob.objects.filter(user=user, bundle=bundle)
+        .only('status', 'baseline_hash', 'bundle_hash', 'started', 'finished')
+        .order_by('-created')
+        .first()
+    )
+
+
+def get_scenario(model):
+    """
+    return (status, summary) of the scenario of a ChoiceModel, where summary is only given once the status is done
+
+    the latest job of the scenario is used if it was evaluated from the current baseline calibration and modified
+    sites. otherwise, or when its job was lost (running for longer than CHOICE_MODEL_JOB_TIMEOUT) or failed long
+    enough ago to be retried (see _is_retry_due), a new job is queued
+    """
+    job = _get_latest_job(model.user, model.bundle)
+    status = _get_job_status(job, lambda: get_scenario_hashes(model))
+
+    if status == ScenarioJob.DONE:
+        return status, pickle.loads(ScenarioJob.objects.values_list('summary', flat=True).get(id=job.id))
+
+    if status == STALE:
+        enqueue(model.user, model.bundle)
+        return ScenarioJob.PENDING, None
+
+    return status, None
+
+
+def get_scenario_status(user, bundle, get_hashes):
+    """
+    return status of the scenario of user and bundle (None meaning the baseline) as get_scenario gives it, or STALE
+    where get_scenario would queue a new job, for polling: the summary is never loaded and no job is ever queued
+
+    get_hashes() returns the current hashes of the scenario (see get_scenario_hashes), only called once its latest
+    job is done or failed, so polling a scenario that is still being evaluated does not load its rows
+    """
+    return _get_job_status(_get_latest_job(user, bundle), get_hashes)
@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from authentication.models import CustomUser
+from choice_model import benchmark, constants
+
+
+class Command(BaseCommand):
+    help = (
+        'Time each stage of evaluating a bundle (and the whole BundleList request) for a range of custom sites and block groups. '
+        'Runs against a temporary test database, so run it with the development (SQLite) settings to benchmark offline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--custom-sites', type=int, nargs='+', default=[0, 10, 50], help='numbers of custom sites to add to the bundle')
+        parser.add_argument(
+            '--block-groups', type=int, nargs='+', default=[None],
+            help='numbers of block groups, more than the real ones are synthetic copies of them (default: the real block groups)',
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='evaluations to take the median time of')
+        parser.add_argument('--output', help='file to write the results to as JSON')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.25, help='fraction by which a stage may get slower (or use more memory) than in --compare')
+
+    def handle(self, *args, **options):
+        constants.warm_up()
+
+        setup_test_environment(debug=False)
+        database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # scenarios are evaluated within requests, rather than by background jobs running alongside
+            with override_settings(CHOICE_MODEL_BACKGROUND_JOBS=False):
+                user = CustomUser.objects.create_user('benchmark@email.com', 'benchmark')
+                results = benchmark.run(user, options['custom_sites'], options['block_groups'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(database_name, verbosity=0)
+            teardown_test_environment()
+
+        for result in results:
+            peak = '' if result['peak_bytes'] is None else f"{result['peak_bytes'] / 1024:>10.0f} KiB"
+            self.stdout.write(
+                f"{result['custom_sites']:>5} sites {result['block_groups']:>6} block groups  "
+                f"{result['stage']:<25} {result['seconds'] * 1000:>10.2f} ms {peak}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'environment': benchmark.get_environment(), 'repeat': options['repeat'], 'results': results}, f, indent=2)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+            regressions = benchmark.compare(results, baseline['results'], options['threshold'])
+            if regressions:
+                raise CommandError('Stages regressed past the threshold:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No stage regressed by more than {options['threshold']:.0%}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from choice_model import benchmark, constants
+
+
+class Command(BaseCommand):
+    help = 'Time the figure builders of the dashboard against building the same figures with plotly express'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='builds of each figure to take the median time of')
+
+    def handle(self, *args, **options):
+        constants.warm_up()
+
+        for result in benchmark.run_figures(options['repeat']):
+            builder, px = result['builder_seconds'], result['px_seconds']
+            self.stdout.write(
+                f"{result['figure']:<30} {builder * 1000:>10.3f} ms {px * 1000:>10.3f} ms with plotly express  {px / builder:>8.1f}x"
+            )
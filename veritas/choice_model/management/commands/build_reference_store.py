@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from choice_model import constants
+from choice_model.constants import CURRENT_PATH, STORE_PATH
+from choice_model.geo import build_geometries
+from choice_model.reference import build_store
+
+
+class Command(BaseCommand):
+    help = 'Convert the reference parquet files into the memory-mapped store used by the choice model, and simplify the block group shapes served to maps'
+
+    def handle(self, *args, **options):
+        path = build_store(CURRENT_PATH, STORE_PATH)
+        self.stdout.write(self.style.SUCCESS(f'Reference store is at {path}'))
+
+        path = build_geometries(CURRENT_PATH / 'wake_bg.json', STORE_PATH, constants.BLOCK_GROUPS)
+        self.stdout.write(self.style.SUCCESS(f'Block group shapes are at {path}'))
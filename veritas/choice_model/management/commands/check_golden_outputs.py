@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from choice_model import golden
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the outputs of a choice model engine for every fixture scenario against the golden outputs, '
+        'or update the golden outputs from the pandas reference model. Runs against a temporary test database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', choices=list(golden.ENGINES), default='full', help='engine to evaluate the scenarios with')
+        parser.add_argument('--rtol', type=float, default=golden.DEFAULT_RTOL, help='relative tolerance')
+        parser.add_argument('--atol', type=float, default=golden.DEFAULT_ATOL, help='absolute tolerance')
+        parser.add_argument('--update', action='store_true', help='save the outputs of the reference model (choice_model/pandas_model.py) as the new golden outputs')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # saving the fixture scenarios does not start background jobs evaluating them
+            with override_settings(CHOICE_MODEL_BACKGROUND_JOBS=False):
+                outputs = golden.evaluate_scenarios(golden.REFERENCE if options['update'] else options['engine'])
+        finally:
+            connection.creation.destroy_test_db(database_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['update']:
+            golden.save(outputs)
+            self.stdout.write(self.style.SUCCESS(f'Saved golden outputs of {len(outputs)} scenarios to {golden.GOLDEN_OUTPUTS_PATH}'))
+            return
+
+        block_groups, golden_outputs = golden.load()
+        report = golden.compare(outputs, golden_outputs, block_groups, rtol=options['rtol'], atol=options['atol'])
+        if report:
+            raise CommandError(f"Outputs of the {options['engine']} engine differ from the golden outputs:\n" + '\n'.join(report))
+        self.stdout.write(self.style.SUCCESS(f"Outputs of the {options['engine']} engine match the golden outputs"))
@@ -0,0 +1,77 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+TABLES_SQL = '''
+    SELECT relname, n_live_tup, seq_scan, COALESCE(idx_scan, 0),
+        pg_total_relation_size(relid), pg_relation_size(relid), pg_indexes_size(relid)
+    FROM pg_stat_user_tables
+    WHERE relname = ANY(%s)
+    ORDER BY pg_total_relation_size(relid) DESC
+'''
+
+INDEXES_SQL = '''
+    SELECT relname, indexrelname, idx_scan, idx_tup_read, pg_relation_size(indexrelid)
+    FROM pg_stat_user_indexes
+    WHERE relname = ANY(%s)
+    ORDER BY relname, indexrelname
+'''
+
+
+def _format_bytes(size):
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024 or unit == 'GiB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Report the size of the tables of the given apps and how often their indexes are used, on PostgreSQL. '
+        'Tables mostly read by sequential scans and indexes that are never used are flagged'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_labels', nargs='*', default=['choice_model', 'authentication'], help='apps whose tables to report on')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='database to report on')
+        parser.add_argument('--analyze', action='store_true', help='run ANALYZE on the tables first, refreshing the statistics of the query planner')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError(f'Database reports need PostgreSQL, {options["database"]} uses {connection.vendor}')
+
+        try:
+            tables = [model._meta.db_table for app_label in options['app_labels'] for model in apps.get_app_config(app_label).get_models()]
+        except LookupError as error:
+            raise CommandError(error)
+
+        with connection.cursor() as cursor:
+            if options['analyze']:
+                for table in tables:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(table)}')
+
+            cursor.execute(TABLES_SQL, [tables])
+            table_rows = cursor.fetchall()
+            cursor.execute(INDEXES_SQL, [tables])
+            index_rows = cursor.fetchall()
+
+        self.stdout.write(f'{"table":<40} {"rows":>10} {"seq scans":>10} {"idx scans":>10} {"total":>10} {"data":>10} {"indexes":>10}')
+        for table, rows, seq_scans, index_scans, total_size, data_size, indexes_size in table_rows:
+            line = (
+                f'{table:<40} {rows:>10} {seq_scans:>10} {index_scans:>10} '
+                f'{_format_bytes(total_size):>10} {_format_bytes(data_size):>10} {_format_bytes(indexes_size):>10}'
+            )
+            # sequential scans of small tables are cheaper than using an index, so only larger ones are flagged
+            if seq_scans > index_scans and rows > 1000:
+                line = self.style.WARNING(line + '  mostly sequential scans')
+            self.stdout.write(line)
+
+        self.stdout.write('')
+        self.stdout.write(f'{"table":<40} {"index":<45} {"scans":>10} {"tuples read":>12} {"size":>10}')
+        for table, index, scans, tuples_read, size in index_rows:
+            line = f'{table:<40} {index:<45} {scans:>10} {tuples_read:>12} {_format_bytes(size):>10}'
+            if scans == 0:
+                line = self.style.WARNING(line + '  unused')
+            self.stdout.write(line)
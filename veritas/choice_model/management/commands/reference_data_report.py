@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from choice_model import constants
+
+
+class Command(BaseCommand):
+    help = 'Load every reference dataset and report how long each took to load and how much memory it holds'
+
+    def handle(self, *args, **options):
+        constants.warm_up(trace_memory=True)
+
+        for name, stats in constants.REGISTRY.report().items():
+            self.stdout.write(f"{name:<25} {stats['seconds'] * 1000:>10.1f} ms {stats['bytes'] / 1024:>12.1f} KiB")
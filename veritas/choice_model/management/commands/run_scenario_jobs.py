@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from choice_model.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued scenario evaluations, for deployments where web processes do not run them (CHOICE_MODEL_JOB_THREADS = 0)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='exit once there are no pending jobs')
+        parser.add_argument('--interval', type=float, default=1.0, help='seconds to wait before looking for new jobs')
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f'Ran {count} scenario jobs')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
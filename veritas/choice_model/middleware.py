@@ -0,0 +1,122 @@
+import asyncio
+import cProfile
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from choice_model.profiling import asks_for_profile, is_profiling_requested, profiling_threads, save_profile
+from choice_model.timing import STATISTICS, request_timings
+
+
+logger = logging.getLogger('choice_model.timing')
+
+# held while an async request is profiled. the profiler hooks the thread of the event loop, which every async request
+# shares, so enabling another one there would take over the hook of the first (or raise ValueError from python 3.12)
+_async_profiling_lock = threading.Lock()
+
+# both middlewares below run in the mode of the handler they wrap, so async views are served without being adapted
+# to sync (and back) around them. the context variables they set are then set within the task of the request, which
+# carries them into the threads of sync_to_async, where its queries run and are timed (see signals.py)
+
+
+def _record_timings(request, response, timings, start):
+    timings.add('total', time.perf_counter() - start)
+
+    if settings.CHOICE_MODEL_SERVER_TIMING:
+        response['Server-Timing'] = timings.get_server_timing()
+
+    logger.info(
+        'method=%s path=%s status=%s %s', request.method, request.path, response.status_code, timings.get_log_fields(),
+        extra={'stages': dict(timings.durations)},
+    )
+    STATISTICS.add(timings)
+
+    return response
+
+
+@sync_and_async_middleware
+def ServerTimingMiddleware(get_response):
+    """
+    time the stages of every request (see choice_model/timing.py) along with its database queries and total duration
+
+    durations are sent as a Server-Timing header (when CHOICE_MODEL_SERVER_TIMING is on), logged, and
+    added to the statistics shown to staff at /timing/
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            with request_timings() as timings:
+                response = await get_response(request)
+
+            return _record_timings(request, response, timings, start)
+
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            with request_timings() as timings:
+                response = get_response(request)
+
+            return _record_timings(request, response, timings, start)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def ProfilingMiddleware(get_response):
+    """
+    profile requests of staff asking for it (?profile=1 or an X-Profile header) with cProfile, and store the
+    profile to be looked at in the admin (see choice_model/profiling.py)
+
+    async requests are profiled on the thread of the event loop while they are being handled, which includes whatever
+    else the loop runs in the meantime, and on the threads of run_in_thread (but not of other sync_to_async calls).
+    only one of them is profiled at a time, others asking for it meanwhile are served unprofiled
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            # the user is only loaded (from the database) when the request asks to be profiled
+            if not asks_for_profile(request) or not await sync_to_async(is_profiling_requested)(request):
+                return await get_response(request)
+
+            if not _async_profiling_lock.acquire(blocking=False):
+                logger.warning('path=%s not profiled, another request is being profiled', request.path)
+                return await get_response(request)
+
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            try:
+                with profiling_threads() as thread_profilers:
+                    profiler.enable()
+                    try:
+                        response = await get_response(request)
+                    finally:
+                        profiler.disable()
+            finally:
+                _async_profiling_lock.release()
+            duration = time.perf_counter() - start
+
+            profile = await sync_to_async(save_profile)(request, response, profiler, duration, thread_profilers)
+            response['X-Profile-Id'] = str(profile.id)
+
+            return response
+
+    else:
+        def middleware(request):
+            if not is_profiling_requested(request):
+                return get_response(request)
+
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            with profiling_threads() as thread_profilers:
+                response = profiler.runcall(get_response, request)
+            duration = time.perf_counter() - start
+
+            profile = save_profile(request, response, profiler, duration, thread_profilers)
+            response['X-Profile-Id'] = str(profile.id)
+
+            return response
+
+    return middleware
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("choice_model", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="modifiedsite",
+            name="distances",
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("choice_model", "0003_requestprofile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScenarioJob",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("status", models.CharField(choices=[("pending", "Pending"), ("running", "Running"), ("done", "Done"), ("failed", "Failed")], default="pending", max_length=10)),
+                ("baseline_hash", models.CharField(blank=True, max_length=40)),
+                ("bundle_hash", models.CharField(blank=True, max_length=40)),
+                ("summary", models.BinaryField(null=True)),
+                ("error", models.TextField(blank=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("started", models.DateTimeField(null=True)),
+                ("finished", models.DateTimeField(null=True)),
+                ("bundle", models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to="choice_model.modifiedsitesbundle")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["-created"],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.1.3 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+def check_duplicate_baselines(apps, schema_editor):
+    """
+    refuse to make baseline models unique per user, and calibration visits unique per site of a baseline, while
+    there are duplicates, listing them so they can be resolved by hand (e.g. in the admin) before migrating again
+
+    ids are random (uuid4) and the rows have no timestamp, so there is no telling which of the duplicates the choice
+    model has been reading, and calibration data is not deleted on a guess
+    """
+    BaselineModel = apps.get_model("choice_model", "BaselineModel")
+    BaselineSite = apps.get_model("choice_model", "BaselineSite")
+
+    duplicates = []
+    for duplicate in BaselineModel.objects.values("user").annotate(count=models.Count("id")).filter(count__gt=1).order_by("user"):
+        ids = BaselineModel.objects.filter(user=duplicate["user"]).values_list("id", flat=True)
+        duplicates.append(f"user {duplicate['user']} has {duplicate['count']} baseline models: {', '.join(map(str, ids))}")
+
+    for duplicate in BaselineSite.objects.values("baseline_model", "name").annotate(count=models.Count("id")).filter(count__gt=1).order_by("baseline_model", "name"):
+        ids = BaselineSite.objects.filter(baseline_model=duplicate["baseline_model"], name=duplicate["name"]).values_list("id", flat=True)
+        duplicates.append(
+            f"baseline model {duplicate['baseline_model']} has {duplicate['count']} visits for {duplicate['name']!r}: {', '.join(map(str, ids))}"
+        )
+
+    if duplicates:
+        raise RuntimeError(
+            "Remove the duplicate baselines below (keeping one of each) before applying this migration:\n" + "\n".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("choice_model", "0004_scenariojob"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="modifiedsite",
+            index=models.Index(fields=["bundle", "name"], name="modifiedsite_bundle_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scenariojob",
+            index=models.Index(fields=["user", "bundle", "-created"], name="scenariojob_scenario_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scenariojob",
+            index=models.Index(fields=["status", "created"], name="scenariojob_status_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="site",
+            index=models.Index(fields=["name"], name="site_name_idx"),
+        ),
+        migrations.RunPython(check_duplicate_baselines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="baselinemodel",
+            constraint=models.UniqueConstraint(fields=("user",), name="unique_baseline_model_user"),
+        ),
+        migrations.AddConstraint(
+            model_name="baselinesite",
+            constraint=models.UniqueConstraint(fields=("baseline_model", "name"), name="unique_baseline_site_name"),
+        ),
+    ]
@@ -1,6 +1,9 @@
+import numpy as np
 import uuid
 from django.db import models
 from authentication.models import CustomUser
+from choice_model import constants
+from choice_model.geo import get_block_group_distances
 
 
 class Site(models.Model):
@@ -18,6 +21,10 @@ class Site(models.Model):
     bathrooms = models.IntegerField()
     playgrounds = models.IntegerField()
 
+    class Meta:
+        # names are not unique, several existing sites share one
+        indexes = [models.Index(fields=['name'], name='site_name_idx')]
+
     def __str__(self):
         return self.name
 
@@ -52,12 +59,58 @@ class ModifiedSite(models.Model):
     bathrooms = models.IntegerField()
     playgrounds = models.IntegerField(choices=CHOICES)
 
+    # float32 distances (in miles) from a custom added site to every block group, see get_distances()
+    distances = models.BinaryField(null=True, editable=False)
+
+    class Meta:
+        # not unique, since existing sites share names and later modified sites of a name take precedence
+        indexes = [models.Index(fields=['bundle', 'name'], name='modifiedsite_bundle_name_idx')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # remember the saved location so distances are only recalculated when it changes
+        instance._saved_location = (instance.latitude, instance.longitude)
+
+        return instance
+
+    def save(self, *args, **kwargs):
+        location_changed = getattr(self, '_saved_location', None) != (self.latitude, self.longitude)
+        if self.is_custom and (self.distances is None or location_changed):
+            self.distances = get_block_group_distances(self.latitude, self.longitude).tobytes()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'distances'}
+
+        super().save(*args, **kwargs)
+        self._saved_location = (self.latitude, self.longitude)
+
+    @property
+    def is_custom(self):
+        """
+        whether the site is added by the user rather than a modification of an existing site
+        """
+        return self.name not in constants.SITE_DATA.index
+
+    def get_distances(self):
+        """
+        return (B,) distances from the site to every block group
+        """
+        # sites saved before distances were stored have them calculated here instead
+        if self.distances is None:
+            return get_block_group_distances(self.latitude, self.longitude)
+        return np.frombuffer(self.distances, dtype=np.float32)
+
 
 class BaselineModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
     name = models.CharField(max_length=255)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 
+    class Meta:
+        # a user recalibrates the one baseline they have
+        constraints = [models.UniqueConstraint(fields=['user'], name='unique_baseline_model_user')]
+
     def __str__(self):
         return f'{self.name} ({self.user.email})'
 
@@ -68,5 +121,69 @@ class BaselineSite(models.Model):
     name = models.CharField(max_length=255)
     visits = models.FloatField()
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['baseline_model', 'name'], name='unique_baseline_site_name')]
+
     def __str__(self):
         return f'{self.name} ({self.baseline_model.name})'
+
+
+class RequestProfile(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(CustomUser, null=True, on_delete=models.SET_NULL)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status_code = models.IntegerField()
+    duration = models.FloatField()
+
+    # top functions by cumulative time, the full profile is kept on disk (see choice_model/profiling.py)
+    summary = models.TextField()
+    file_name = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.created:%Y-%m-%d %H:%M:%S})'
+
+
+class ScenarioJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    bundle = models.ForeignKey('ModifiedSitesBundle', null=True, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+
+    # content the scenario was evaluated from, see get_baseline_hash and get_bundle_hash
+    baseline_hash = models.CharField(max_length=40, blank=True)
+    bundle_hash = models.CharField(max_length=40, blank=True)
+
+    # pickled ChoiceModelSummary once done, traceback once failed
+    summary = models.BinaryField(null=True, editable=False)
+    error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            # latest job of a scenario (see get_scenario) and oldest pending job (see claim_job)
+            models.Index(fields=['user', 'bundle', '-created'], name='scenariojob_scenario_idx'),
+            models.Index(fields=['status', 'created'], name='scenariojob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.bundle or "Baseline"} ({self.status})'
@@ -0,0 +1,107 @@
+import cProfile
+import io
+import pstats
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+from choice_model.models import RequestProfile
+
+
+# query parameter (?profile=1) or header (X-Profile: 1) asking for the request to be profiled
+PROFILE_PARAMETER = 'profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+# profilers of the work a profiled request runs on other threads, which its own profiler does not see
+_thread_profilers = ContextVar('choice_model_thread_profilers', default=None)
+
+
+def asks_for_profile(request):
+    """
+    whether the request asks to be profiled, whoever made it
+    """
+    return PROFILE_PARAMETER in request.GET or PROFILE_HEADER in request.META
+
+
+def is_profiling_requested(request):
+    """
+    whether the request asks to be profiled, which only staff can do
+    """
+    return asks_for_profile(request) and request.user.is_authenticated and request.user.is_staff
+
+
+def get_profile_path(file_name):
+    return Path(settings.CHOICE_MODEL_PROFILE_DIR) / file_name
+
+
+@contextmanager
+def profiling_threads():
+    """
+    collect the profilers of functions run with profile_call within the with block into a list
+    """
+    profilers = []
+    token = _thread_profilers.set(profilers)
+    try:
+        yield profilers
+    finally:
+        _thread_profilers.reset(token)
+
+
+def profile_call(function, *args):
+    """
+    return function(*args), profiled when called on behalf of a profiled request (see profiling_threads)
+    """
+    profilers = _thread_profilers.get()
+    if profilers is None:
+        return function(*args)
+
+    profiler = cProfile.Profile()
+    profilers.append(profiler)
+    return profiler.runcall(function, *args)
+
+
+def get_summary(stats, limit):
+    """
+    return text table of the limit functions with the most cumulative time
+    """
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+
+    return stream.getvalue()
+
+
+def save_profile(request, response, profiler, duration, thread_profilers=()):
+    """
+    store the profile of a request (along with the profiles of its threads), keeping only the CHOICE_MODEL_PROFILES
+    most recent ones
+    """
+    stats = pstats.Stats(profiler)
+    if thread_profilers:
+        stats.add(*thread_profilers)
+
+    profile = RequestProfile(
+        user=request.user,
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        status_code=response.status_code,
+        duration=duration,
+    )
+    profile.file_name = f'{profile.id}.prof'
+
+    path = get_profile_path(profile.file_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stats.dump_stats(path)
+
+    # the summary strips the directories of the stats, so it is taken once they are saved
+    profile.summary = get_summary(stats, settings.CHOICE_MODEL_PROFILE_LINES)
+    profile.save()
+
+    # files of the profiles deleted here are removed along with them (see signals.py)
+    for old_profile in RequestProfile.objects.all()[settings.CHOICE_MODEL_PROFILES:]:
+        old_profile.delete()
+
+    return profile
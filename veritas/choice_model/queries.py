@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from choice_model.models import BaselineModel, BaselineSite, ModifiedSite
+
+
+class ScenarioData():
+    """
+    rows the scenarios of a user are evaluated from: their baseline calibration and the modified sites of some bundles
+
+    views load these once per request (at most 3 queries, however many bundles and sites there are) and pass them
+    to every ChoiceModel they build, so the models never query the database themselves
+    """
+
+    def __init__(self, user, baseline_model, baseline_sites, modified_sites):
+        self.user = user
+        self.baseline_model = baseline_model
+        self.baseline_sites = baseline_sites
+        self._modified_sites = modified_sites
+
+    @staticmethod
+    def _get_bundle_ids(bundles):
+        return [bundle.pk for bundle in bundles if bundle is not None]
+
+    @classmethod
+    def load(cls, user, bundles=()):
+        """
+        return data of user, with the modified sites of bundles (ModifiedSitesBundle objects, None meaning the baseline)
+        """
+        baseline_model = BaselineModel.objects.filter(user=user).first()
+
+        baseline_sites = []
+        if baseline_model is not None:
+            baseline_sites = list(BaselineSite.objects.filter(baseline_model=baseline_model).only('name', 'visits'))
+
+        modified_sites = defaultdict(list)
+        bundle_ids = cls._get_bundle_ids(bundles)
+        if bundle_ids:
+            for modified_site in ModifiedSite.objects.filter(bundle__in=bundle_ids):
+                modified_sites[modified_site.bundle_id].append(modified_site)
+
+        return cls(user, baseline_model, baseline_sites, modified_sites)
+
+    @classmethod
+    async def aload(cls, user, bundles=()):
+        """
+        load with the async ORM, for use in async views
+        """
+        baseline_model = await BaselineModel.objects.filter(user=user).afirst()
+
+        baseline_sites = []
+        if baseline_model is not None:
+            baseline_sites = [site async for site in BaselineSite.objects.filter(baseline_model=baseline_model).only('name', 'visits')]
+
+        modified_sites = defaultdict(list)
+        bundle_ids = cls._get_bundle_ids(bundles)
+        if bundle_ids:
+            async for modified_site in ModifiedSite.objects.filter(bundle__in=bundle_ids):
+                modified_sites[modified_site.bundle_id].append(modified_site)
+
+        return cls(user, baseline_model, baseline_sites, modified_sites)
+
+    def get_modified_sites(self, bundle):
+        """
+        return list of the modified sites of bundle, which has to be one of the bundles loaded
+        """
+        if bundle is None:
+            return []
+
+        return self._modified_sites[bundle.pk]
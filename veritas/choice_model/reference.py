@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from choice_model.timing import stage
+
+
+# parquet files in the data directory that make up the reference data
+SOURCES = [
+    'site_data.parquet',
+    'site_coefficients.parquet',
+    'distances.parquet',
+    'model_population.parquet',
+    'site_locations.parquet',
+    'baseline_visits.parquet',
+]
+
+
+def get_distance_rows(site_index, distance_index):
+    """
+    return the position in distance_index of the row belonging to each site in site_index
+
+    site names are not unique in the reference data, so the n-th occurrence of a name in
+    site_index is paired with the n-th occurrence of that name in distance_index
+    """
+    site_keys = pd.MultiIndex.from_arrays([site_index, site_index.to_series().groupby(level=0).cumcount()])
+    distance_keys = pd.MultiIndex.from_arrays([distance_index, distance_index.to_series().groupby(level=0).cumcount()])
+
+    return distance_keys.get_indexer(site_keys)
+
+
+def read_sources(data_path):
+    """
+    return dictionary of reference dataframes read from the parquet files in data_path
+    """
+    site_data = pd.read_parquet(data_path / 'site_data.parquet')
+    distances = pd.read_parquet(data_path / 'distances.parquet')
+
+    # fix the site order (by name) once, with the distance row of every site in the same order
+    site_data = site_data.iloc[np.argsort(site_data.index, kind='stable')]
+    site_distances = distances.iloc[get_distance_rows(site_data.index, distances.index)]
+
+    return {
+        'site_data': site_data.astype(float),
+        'site_coefficients': pd.read_parquet(data_path / 'site_coefficients.parquet'),
+        'distances': distances,
+        'site_distances': site_distances,
+        'population': pd.read_parquet(data_path / 'model_population.parquet'),
+        'site_locations': pd.read_parquet(data_path / 'site_locations.parquet'),
+        'baseline_visits': pd.read_parquet(data_path / 'baseline_visits.parquet').set_index('site_name'),
+    }
+
+
+def get_fingerprint(data_path):
+    """
+    return hash of the contents of the parquet files, used to name the store built from them
+    """
+    fingerprint = hashlib.sha1()
+    for source in SOURCES:
+        fingerprint.update(source.encode())
+        fingerprint.update((data_path / source).read_bytes())
+
+    return fingerprint.hexdigest()
+
+
+def build_store(data_path, store_path):
+    """
+    convert the parquet files in data_path into a store of .npy arrays plus a manifest of their labels
+
+    return the directory of the store, which is named by the fingerprint of the parquet files so a
+    store is never rebuilt for the same data and a changed data file gets a fresh store
+    """
+    path = store_path / get_fingerprint(data_path)
+    if (path / 'manifest.json').exists():
+        return path
+
+    # build in a temporary directory so other processes never see a partially written store
+    temporary_path = store_path / f'{path.name}.tmp-{os.getpid()}'
+    temporary_path.mkdir(parents=True, exist_ok=True)
+
+    manifest = {}
+    for name, frame in read_sources(data_path).items():
+        np.save(temporary_path / f'{name}.npy', np.ascontiguousarray(frame.values, dtype=float))
+        manifest[name] = {
+            'index': frame.index.tolist(),
+            'index_name': frame.index.name,
+            'columns': frame.columns.tolist(),
+        }
+
+    with open(temporary_path / 'manifest.json', 'w') as f:
+        json.dump(manifest, f)
+
+    try:
+        temporary_path.rename(path)
+    except OSError:
+        # another process finished building the same store first
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+    return path
+
+
+def load_store(data_path, store_path):
+    """
+    return dictionary of read-only reference dataframes backed by memory-mapped arrays
+
+    every process maps the same files, so the operating system shares their pages between
+    processes instead of each one holding its own copy
+    """
+    path = build_store(data_path, store_path)
+
+    with open(path / 'manifest.json') as f:
+        manifest = json.load(f)
+
+    reference_data = {}
+    for name, labels in manifest.items():
+        values = np.load(path / f'{name}.npy', mmap_mode='r')
+        index = pd.Index(labels['index'], name=labels['index_name'])
+        reference_data[name] = pd.DataFrame(values, index=index, columns=labels['columns'], copy=False)
+
+    return reference_data
+
+
+class ReferenceRegistry():
+    """
+    registry of reference datasets that are each loaded on first access and then kept for the life of the process
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._datasets = {}
+        self._stats = {}
+        self._nested = []
+        self._trace_memory = False
+        self._lock = threading.RLock()
+
+    def register(self, name):
+        """
+        decorator registering a function (taking no arguments) that loads the dataset called name
+        """
+        def decorator(loader):
+            self._loaders[name] = loader
+            return loader
+
+        return decorator
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def get(self, name):
+        if name in self._datasets:
+            return self._datasets[name]
+
+        with self._lock, stage('reference_data'):
+            if name not in self._datasets:
+                self._datasets[name] = self._load(name)
+
+        return self._datasets[name]
+
+    def _load(self, name):
+        """
+        load a dataset, recording how long it took and, when warmed up with trace_memory, how much (non-shared) memory
+        it holds on to
+
+        datasets loaded by the loader itself (dependencies) are recorded separately and not counted twice
+        """
+        # tracing memory slows down every allocation, so it is left to reports rather than done on lazy loads
+        trace_memory = self._trace_memory
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+
+        self._nested.append({'seconds': 0, 'bytes': 0})
+        memory_before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+        start = time.perf_counter()
+        try:
+            dataset = self._loaders[name]()
+        finally:
+            seconds = time.perf_counter() - start
+            memory = max(tracemalloc.get_traced_memory()[0] - memory_before, 0) if trace_memory else 0
+            nested = self._nested.pop()
+            if started_tracing:
+                tracemalloc.stop()
+
+        self._stats[name] = {
+            'seconds': seconds - nested['seconds'],
+            'bytes': max(memory - nested['bytes'], 0) if trace_memory else None,
+        }
+        if self._nested:
+            self._nested[-1]['seconds'] += seconds
+            self._nested[-1]['bytes'] += memory
+
+        return dataset
+
+    @contextmanager
+    def override(self, **datasets):
+        """
+        replace the given datasets (e.g. with synthetic ones in benchmarks) until the end of the with block
+        """
+        with self._lock:
+            previous = {name: self._datasets[name] for name in datasets if name in self._datasets}
+            self._datasets.update(datasets)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                for name in datasets:
+                    self._datasets.pop(name, None)
+                self._datasets.update(previous)
+
+    def warm_up(self, names=None, trace_memory=False):
+        """
+        load the given datasets (all of them by default) ahead of the first request that needs them, recording the
+        memory of those loaded here when trace_memory is set
+        """
+        with self._lock:
+            self._trace_memory = trace_memory
+            try:
+                for name in names or self._loaders:
+                    self.get(name)
+            finally:
+                self._trace_memory = False
+
+    def report(self):
+        """
+        return dictionary with dataset names as keys and whether they are loaded, load time and memory as values
+
+        memory is None unless the dataset was loaded by warm_up with trace_memory. memory-mapped arrays count as
+        nothing since their pages are shared with other processes
+        """
+        return {
+            name: {'loaded': name in self._datasets, **self._stats.get(name, {'seconds': None, 'bytes': None})}
+            for name in self._loaders
+        }
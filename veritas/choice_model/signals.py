@@ -0,0 +1,32 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from choice_model.jobs import enqueue_bundle
+from choice_model.models import ModifiedSite, RequestProfile
+from choice_model.profiling import get_profile_path
+from choice_model.timing import time_query
+
+
+@receiver(post_save, sender=ModifiedSite)
+@receiver(post_delete, sender=ModifiedSite)
+def evaluate_modified_site_bundle(sender, instance, **kwargs):
+    """
+    start evaluating a bundle in the background as soon as it is saved, so its results are likely ready once viewed
+    """
+    enqueue_bundle(instance.bundle_id)
+
+
+@receiver(post_delete, sender=RequestProfile)
+def delete_request_profile_file(sender, instance, **kwargs):
+    get_profile_path(instance.file_name).unlink(missing_ok=True)
+
+
+@receiver(connection_created)
+def time_connection_queries(sender, connection, **kwargs):
+    """
+    time the queries of every connection as the db stage of the request they are made for, whichever thread (or
+    sync_to_async call of an async view) they run on. outside of requests nothing is timed
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
@@ -1,11 +1,45 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import warnings
+
+from datetime import timedelta
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from plotly.utils import PlotlyJSONEncoder
 from authentication.models import *
+from choice_model import benchmark, constants, dashapp_helpers, dashboard, geo, golden, jobs, middleware, px_figures
+from choice_model import cache as cache_module
+from choice_model.cache import BoundedLocMemCache, get_results_cache, invalidate_baseline_summary
 from choice_model.choicemodel import *
+from choice_model.concurrency import run_concurrently
+from choice_model.dashapp_helpers import create_spatial_equity_fig
+from choice_model.geo import BlockGroups, get_block_group_geojson_url, load_geometries
+from choice_model.middleware import ProfilingMiddleware, ServerTimingMiddleware
 from choice_model.models import *
+from choice_model.reference import ReferenceRegistry
+from choice_model.timing import stage
 
 
 class ChoiceModelTestCase(TestCase):
     def setUp(self):
+        # results are cached by content, which would carry over between tests
+        get_results_cache().clear()
+
         # create fake user for linking the choice model to
         self.dummy_user = CustomUser.objects.create_user('dummy_user@email.com', 'dummy_password')
 
@@ -36,3 +70,579 @@ class ChoiceModelTestCase(TestCase):
     def test_counterfactual(self):
         counterfactual = ChoiceModel(self.dummy_user, self.dummy_bundle)
         # print(choice_model.get_site_visits())
+
+    def test_results_computed_once(self):
+        counterfactual = ChoiceModel(self.dummy_user, self.dummy_bundle)
+        site_data = counterfactual.site_data.copy()
+
+        counterfactual.get_site_visits()
+        counterfactual.get_equity_evaluation()
+        counterfactual.get_utility_by_block_group()
+
+        # results are memoized and evaluating them does not touch the model inputs
+        self.assertIs(counterfactual.results, counterfactual.results)
+        self.assertTrue(counterfactual.site_data.equals(site_data))
+
+    def test_baseline_summary_cached(self):
+        ChoiceModel(self.dummy_user, bundle=None).get_site_visits()
+
+        # a second baseline model of the same user is served from the results cache
+        baseline = ChoiceModel(self.dummy_user, bundle=None)
+        baseline.get_site_visits()
+        self.assertNotIn('results', baseline.__dict__)
+
+        # and is recomputed once the baseline changes
+        invalidate_baseline_summary(self.dummy_user.pk)
+        baseline = ChoiceModel(self.dummy_user, bundle=None)
+        baseline.get_site_visits()
+        self.assertIn('results', baseline.__dict__)
+
+    def test_bundle_summary_shared_and_invalidated(self):
+        ChoiceModel(self.dummy_user, self.dummy_bundle).get_site_visits()
+
+        # a bundle with identical modified sites shares the cached results
+        twin_bundle = ModifiedSitesBundle.objects.create(user=self.dummy_user, nickname='twin_bundle')
+        self.dummy_modified_site.pk = None
+        self.dummy_modified_site.bundle = twin_bundle
+        self.dummy_modified_site.save()
+
+        twin = ChoiceModel(self.dummy_user, twin_bundle)
+        twin.get_site_visits()
+        self.assertNotIn('results', twin.__dict__)
+
+        # editing a modified site forces the bundle to be evaluated again
+        self.dummy_modified_site.acres = 200
+        self.dummy_modified_site.save()
+
+        twin = ChoiceModel(self.dummy_user, twin_bundle)
+        twin.get_site_visits()
+        self.assertIn('results', twin.__dict__)
+
+    def test_bundle_summary_not_stale(self):
+        ChoiceModel(self.dummy_user, self.dummy_bundle).get_site_visits()
+
+        # a modified site changed by another process, where no signal fires in this one
+        ModifiedSite.objects.filter(pk=self.dummy_modified_site.pk).update(acres=200)
+
+        counterfactual = ChoiceModel(self.dummy_user, self.dummy_bundle)
+        full_results = ChoiceModelResults(counterfactual._get_engine(), constants.POPULATION['Black'].values, constants.POPULATION['Other'].values)
+        self.assertTrue(np.allclose(counterfactual.summary.visits, full_results.visits))
+        self.assertIn('results', counterfactual.__dict__)
+
+    def test_custom_site_distances_stored(self):
+        distances = self.dummy_modified_site.get_distances()
+        self.assertEqual(distances.shape, (constants.DISTANCES.shape[1],))
+
+        # distances are only recalculated once the site is moved
+        self.dummy_modified_site.acres = 200
+        self.dummy_modified_site.save()
+        self.assertTrue((self.dummy_modified_site.get_distances() == distances).all())
+
+        self.dummy_modified_site.latitude = 36
+        self.dummy_modified_site.save()
+        self.assertFalse((self.dummy_modified_site.get_distances() == distances).all())
+
+    def test_incremental_results(self):
+        def assert_matches_full_evaluation():
+            counterfactual = ChoiceModel(self.dummy_user, self.dummy_bundle)
+            results = counterfactual.results
+            full_results = ChoiceModelResults(counterfactual._get_engine(), constants.POPULATION['Black'].values, constants.POPULATION['Other'].values)
+
+            self.assertEqual(list(results.site_names), list(full_results.site_names))
+            self.assertTrue(np.allclose(results.visits, full_results.visits))
+            self.assertTrue(np.allclose(results.block_group_utility_black, full_results.block_group_utility_black))
+
+        assert_matches_full_evaluation()
+
+        # edit an existing site, then change and remove the custom site
+        existing_site = ModifiedSite.objects.create(
+            bundle=self.dummy_bundle,
+            latitude=35.8,
+            longitude=-78.6,
+            name=constants.SITE_DATA.index[0],
+            acres=2500,
+            trails=1,
+            trail_miles=2,
+            picnic_area=0,
+            sports_facilities=1,
+            swimming_facilities=0,
+            boat_launch=0,
+            waterbody=1,
+            bathrooms=0,
+            playgrounds=1,
+        )
+        assert_matches_full_evaluation()
+
+        self.dummy_modified_site.acres = 400
+        self.dummy_modified_site.save()
+        assert_matches_full_evaluation()
+
+        self.dummy_modified_site.delete()
+        existing_site.delete()
+        assert_matches_full_evaluation()
+
+    def test_evaluate_many(self):
+        summaries = ChoiceModel.evaluate_many(self.dummy_user, [None, self.dummy_bundle])
+
+        # evaluating bundles together gives the same results as evaluating each on its own
+        for bundle, summary in zip([None, self.dummy_bundle], summaries):
+            results = ChoiceModel(self.dummy_user, bundle).results
+            self.assertTrue(np.allclose(summary.visits, results.visits))
+            self.assertTrue(np.allclose(summary.block_group_utility_black, results.block_group_utility_black))
+            self.assertAlmostEqual(summary.equity_evaluation['average_utility_black'], results.equity_evaluation['average_utility_black'])
+
+    def test_overflowing_attractiveness(self):
+        # a site large enough for exp(utility) to overflow takes nearly every trip, and every output stays finite
+        self.dummy_modified_site.acres = 400000
+        self.dummy_modified_site.save()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            results = ChoiceModel(self.dummy_user, self.dummy_bundle).results
+            full_results = ChoiceModelResults(ChoiceModel(self.dummy_user, self.dummy_bundle)._get_engine(), constants.POPULATION['Black'].values, constants.POPULATION['Other'].values)
+            summary = ChoiceModel.evaluate_many(self.dummy_user, [self.dummy_bundle])[0]
+
+            for visits, block_group_utility_black, equity_evaluation in [
+                (results.visits, results.block_group_utility_black, results.equity_evaluation),
+                (full_results.visits, full_results.block_group_utility_black, full_results.equity_evaluation),
+                (summary.visits, summary.block_group_utility_black, summary.equity_evaluation),
+            ]:
+                self.assertTrue(np.isfinite(visits).all())
+                self.assertTrue(np.isfinite(block_group_utility_black).all())
+                self.assertTrue(np.isfinite(list(equity_evaluation.values())).all())
+                self.assertAlmostEqual(visits[-1] / visits.sum(), 1)
+
+    def test_bundle_comparison(self):
+        self.client.force_login(self.dummy_user)
+        response = self.client.get(reverse('bundle-compare'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([scenario['nickname'] for scenario in response.json()['scenarios']], ['Baseline', 'dummy_bundle'])
+
+    @override_settings(CHOICE_MODEL_BACKGROUND_JOBS=False)
+    def test_figures_built_on_demand(self):
+        self.client.force_login(self.dummy_user)
+        dash_context = self.client.get(reverse('bundles', kwargs={'bundle_id': self.dummy_bundle.id})).context['dash_context']
+        self.assertEqual(set(dash_context), {dashboard.DEFAULT_FIGURE, 'bundle-id'})
+
+        # the other figures are built by the dash app once their tab is selected
+        def select(name, figure=None):
+            body = {
+                'output': f'{name}.figure',
+                'outputs': {'id': name, 'property': 'figure'},
+                'inputs': [{'id': 'radio', 'property': 'value', 'value': 'spatial-equity-plot'}],
+                'state': [
+                    {'id': 'bundle-id', 'property': 'data', 'value': dash_context['bundle-id']['data']},
+                    {'id': name, 'property': 'figure', 'value': figure},
+                ],
+                'changedPropIds': ['radio.value'],
+            }
+            url = reverse('the_django_plotly_dash:app-update-component', kwargs={'ident': 'SiteChoiceProb'})
+            return self.client.post(url, json.dumps(body), content_type='application/json')
+
+        response = select('spatial-equity-plot')
+        figure = response.json()['response']['spatial-equity-plot']['figure']
+        self.assertEqual(len(figure['data'][0]['z']), len(constants.POPULATION))
+
+        # figures of other tabs, or already built, are left as they are
+        self.assertEqual(select('map-scatter-plot').status_code, 204)
+        self.assertEqual(select('spatial-equity-plot', figure).status_code, 204)
+
+    @override_settings(CHOICE_MODEL_BACKGROUND_JOBS=False)
+    def test_concurrent_evaluation(self):
+        self.client.force_login(self.dummy_user)
+        url = reverse('bundles', kwargs={'bundle_id': self.dummy_bundle.id})
+
+        # figures are the same whether the scenarios are evaluated one after another or concurrently
+        figures = []
+        for threads in [1, 4]:
+            with self.settings(CHOICE_MODEL_REQUEST_THREADS=threads):
+                invalidate_baseline_summary(self.dummy_user.pk)
+                self.dummy_modified_site.save()
+                dash_context = self.client.get(url).context['dash_context']
+                figures.append(json.dumps(dash_context, cls=PlotlyJSONEncoder))
+        self.assertEqual(figures[0], figures[1])
+
+        # errors of functions run on other threads are raised by the request
+        with self.settings(CHOICE_MODEL_REQUEST_THREADS=4), self.assertRaises(ZeroDivisionError):
+            run_concurrently(lambda: 1, lambda: 1 / 0)
+
+    @override_settings(CHOICE_MODEL_BACKGROUND_JOBS=False)
+    async def test_async_views(self):
+        urls = [
+            reverse('bundles', kwargs={'bundle_id': self.dummy_bundle.id}),
+            reverse('bundle-update', kwargs={'pk': self.dummy_bundle.id}) + '?show-site=' + self.dummy_modified_site.name,
+            reverse('site-create', kwargs={'pk': self.dummy_bundle.id}),
+        ]
+
+        # views are only shown to users who are logged in
+        self.assertEqual((await self.async_client.get(urls[0])).status_code, 302)
+
+        await sync_to_async(self.async_client.force_login)(self.dummy_user)
+        for url in urls:
+            self.assertEqual((await self.async_client.get(url)).status_code, 200)
+
+    @override_settings(CHOICE_MODEL_BACKGROUND_JOBS=False)
+    def test_query_counts(self):
+        # more bundles and modified sites do not take more queries
+        site = constants.SITE_DATA.index[5]
+        Site.objects.create(name=site, latitude=35.7, longitude=-78.6, **{field: 0 for field in constants.SITE_DATA.columns})
+        for i in range(3):
+            bundle = ModifiedSitesBundle.objects.create(user=self.dummy_user, nickname=f'bundle {i}')
+            for name in constants.SITE_DATA.index[:3]:
+                ModifiedSite.objects.create(bundle=bundle, name=name, latitude=35.8, longitude=-78.6, **{field: 1 for field in constants.SITE_DATA.columns})
+
+        self.client.force_login(self.dummy_user)
+        bundle_id = self.dummy_bundle.id
+
+        # every request also loads the session and user, pages with dash apps also load the app
+        queries = [
+            (reverse('bundles'), 5),
+            (reverse('bundles', kwargs={'bundle_id': bundle_id}), 6),
+            (reverse('bundle-status', kwargs={'bundle_id': bundle_id}), 5),
+            (reverse('bundle-compare'), 5),
+            (reverse('bundle-update', kwargs={'pk': bundle_id}), 6),
+            (reverse('bundle-update', kwargs={'pk': bundle_id}) + '?modified-only=1', 5),
+            (reverse('bundle-update', kwargs={'pk': bundle_id}) + '?show-site=' + site, 6),
+            (reverse('site-create', kwargs={'pk': bundle_id}), 4),
+            (reverse('modified-site-create', kwargs={'pk': bundle_id, 'site_name': site}), 3),
+        ]
+        for url, count in queries:
+            # dash apps are stored on their first use
+            self.client.get(url)
+
+            with self.subTest(url=url), self.assertNumQueries(count):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(CHOICE_MODEL_BACKGROUND_JOBS=False)
+    def test_server_timing(self):
+        self.client.force_login(self.dummy_user)
+        response = self.client.get(reverse('bundles', kwargs={'bundle_id': self.dummy_bundle.id}))
+
+        stages = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        for name in ['db', 'figures', 'render', 'total']:
+            self.assertIn(name, stages)
+
+        # statistics of the stages are only shown to staff
+        self.assertEqual(self.client.get(reverse('stage-timings')).status_code, 302)
+        self.dummy_user.is_staff = True
+        self.dummy_user.save()
+        self.assertIn('total', self.client.get(reverse('stage-timings')).json()['stages'])
+
+    async def test_async_middleware(self):
+        async def get_response(request):
+            with stage('view'):
+                await CustomUser.objects.aget(pk=request.user.pk)
+            return HttpResponse()
+
+        # around an async handler both middlewares are async themselves, rather than adapted to sync
+        profiling_middleware = ProfilingMiddleware(ServerTimingMiddleware(get_response))
+        self.assertTrue(asyncio.iscoroutinefunction(profiling_middleware))
+
+        request = RequestFactory().get('/', {'profile': 1})
+        request.user = self.dummy_user
+        request.user.is_staff = True
+        with self.settings(CHOICE_MODEL_PROFILE_DIR=tempfile.mkdtemp()):
+            response = await profiling_middleware(request)
+
+        # stages of the view and its queries are timed within the task of the request
+        stages = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        for name in ['view', 'db', 'total']:
+            self.assertIn(name, stages)
+        self.assertTrue(await RequestProfile.objects.filter(id=response['X-Profile-Id']).aexists())
+
+        # requests asking to be profiled while another one is are served unprofiled
+        with middleware._async_profiling_lock, self.assertLogs('choice_model.timing', 'WARNING'):
+            self.assertNotIn('X-Profile-Id', await profiling_middleware(request))
+
+    @override_settings(CHOICE_MODEL_JOB_THREADS=0)
+    def test_scenario_jobs(self):
+        self.client.force_login(self.dummy_user)
+        url = reverse('bundles', kwargs={'bundle_id': self.dummy_bundle.id})
+        status_url = reverse('bundle-status', kwargs={'bundle_id': self.dummy_bundle.id})
+
+        # saving a modified site queues its bundle once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dummy_modified_site.acres = 120
+            self.dummy_modified_site.save()
+        self.assertTrue(ScenarioJob.objects.filter(bundle=self.dummy_bundle, status=ScenarioJob.PENDING).exists())
+
+        # the page waits for the results until the jobs have run
+        self.assertEqual(self.client.get(url).context['status'], ScenarioJob.PENDING)
+        self.assertEqual(self.client.get(status_url).json()['status'], ScenarioJob.PENDING)
+        self.assertEqual(jobs.run_pending_jobs(), 2)
+        self.assertEqual(self.client.get(status_url).json()['status'], ScenarioJob.DONE)
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['status'], ScenarioJob.DONE)
+
+        # figures of the other tabs are built from the results of the jobs
+        baseline, counterfactual = dashboard.load_scenario(self.dummy_user, self.dummy_bundle.id)
+        self.assertEqual(
+            dashboard.get_figure('equity-evaluation-plot', baseline, counterfactual)['data'][0]['y'][0],
+            ChoiceModel(self.dummy_user, self.dummy_bundle).get_equity_evaluation()['average_utility_black'],
+        )
+
+        # results of an edited bundle are stale, which polling reports without queueing a job, left to the page
+        self.dummy_modified_site.acres = 150
+        self.dummy_modified_site.save()
+        self.assertEqual(self.client.get(status_url).json()['status'], jobs.STALE)
+        self.assertFalse(ScenarioJob.objects.filter(status=ScenarioJob.PENDING).exists())
+        self.assertEqual(self.client.get(url).context['status'], ScenarioJob.PENDING)
+        self.assertEqual(self.client.get(status_url).json()['status'], ScenarioJob.PENDING)
+
+    def test_failed_scenario_jobs_retried(self):
+        model = ChoiceModel(self.dummy_user, self.dummy_bundle)
+        job = ScenarioJob.objects.create(
+            user=self.dummy_user, bundle=self.dummy_bundle, status=ScenarioJob.FAILED,
+            baseline_hash=model.baseline_hash, bundle_hash=jobs._get_bundle_hash(model), finished=timezone.now(),
+        )
+
+        # a failed scenario is not queued again right away
+        self.assertEqual(jobs.get_scenario(model), (ScenarioJob.FAILED, None))
+        self.assertFalse(ScenarioJob.objects.filter(status=ScenarioJob.PENDING).exists())
+
+        # but once the retry delay has passed
+        job.finished -= timedelta(seconds=settings.CHOICE_MODEL_JOB_RETRY_DELAY)
+        job.save()
+        self.assertEqual(jobs.get_scenario(model), (ScenarioJob.PENDING, None))
+        self.assertEqual(jobs.run_pending_jobs(), 1)
+        self.assertEqual(jobs.get_scenario(model)[0], ScenarioJob.DONE)
+
+    def test_request_profile(self):
+        self.client.force_login(self.dummy_user)
+        url = reverse('bundles', kwargs={'bundle_id': self.dummy_bundle.id})
+
+        # only staff can profile requests
+        self.assertNotIn('X-Profile-Id', self.client.get(url, {'profile': 1}))
+        self.dummy_user.is_staff = True
+        self.dummy_user.save()
+
+        with self.settings(CHOICE_MODEL_PROFILE_DIR=tempfile.mkdtemp(), CHOICE_MODEL_PROFILES=1):
+            self.client.get(url, {'profile': 1})
+            profile = RequestProfile.objects.get(id=self.client.get(url, HTTP_X_PROFILE='1')['X-Profile-Id'])
+
+            # older profiles are dropped along with their files
+            self.assertEqual(RequestProfile.objects.count(), 1)
+            self.assertEqual(os.listdir(settings.CHOICE_MODEL_PROFILE_DIR), [profile.file_name])
+            self.assertIn('cumulative', profile.summary)
+
+            # and can be downloaded from the admin as long as their file exists
+            download_url = reverse('admin:choice_model_requestprofile_download', args=[profile.id])
+            self.assertEqual(self.client.get(download_url).status_code, 200)
+            os.remove(os.path.join(settings.CHOICE_MODEL_PROFILE_DIR, profile.file_name))
+            self.assertEqual(self.client.get(download_url).status_code, 404)
+
+
+class BoundedLocMemCacheTestCase(TestCase):
+    def test_size_kept_up_to_date(self):
+        cache = BoundedLocMemCache('test-bounded', {'OPTIONS': {'MAX_BYTES': 3000}})
+        self.addCleanup(cache.clear)
+
+        def assert_size():
+            self.assertEqual(cache_module._sizes['test-bounded'], sum(len(pickled) for pickled in cache._cache.values()))
+
+        cache.set('a', b'a' * 1000)
+        cache.set('a', b'a' * 500)
+        cache.set('b', b'b' * 1000)
+        assert_size()
+
+        # least recently used entries are evicted once the values no longer fit
+        cache.get('a')
+        cache.set('c', b'c' * 1000)
+        cache.set('d', b'd' * 1000)
+        self.assertEqual([cache.get(key) is not None for key in 'abcd'], [True, False, True, True])
+        assert_size()
+
+        cache.delete('a')
+        cache.set('n', 1)
+        cache.incr('n', 10 ** 20)
+        assert_size()
+        cache.clear()
+        assert_size()
+
+
+class ReferenceRegistryTestCase(TestCase):
+    def test_datasets_loaded_on_first_access(self):
+        registry = ReferenceRegistry()
+        registry.register('dummy')(lambda: [0] * 1000)
+
+        self.assertFalse(registry.report()['dummy']['loaded'])
+        self.assertIs(registry.get('dummy'), registry.get('dummy'))
+        self.assertTrue(registry.report()['dummy']['loaded'])
+
+        # memory is only traced when warming up asks for it
+        self.assertIsNone(registry.report()['dummy']['bytes'])
+        registry.register('other')(lambda: [0] * 1000)
+        registry.warm_up(['other'], trace_memory=True)
+        self.assertGreater(registry.report()['other']['bytes'], 0)
+
+
+class BlockGroupsTestCase(TestCase):
+    def test_block_groups(self):
+        square = lambda x: {'type': 'Polygon', 'coordinates': [[[x, 0], [x + 1, 0], [x + 1, 1], [x, 1], [x, 0]]]}
+        block_groups = BlockGroups(
+            ['50100, 1, 0.5, 0.5', '50100, 2, 0.5, 1.5'],
+            [[0.5, 0.5], [0.5, 1.5]],
+            [
+                {'properties': {'GEOID': '501001', 'INTPTLAT': '0.4', 'INTPTLON': '0.6'}, 'geometry': square(0)},
+                {'properties': {'GEOID': '501002'}, 'geometry': square(1)},
+                {'properties': {'GEOID': '999999'}, 'geometry': square(2)},
+            ],
+        )
+
+        self.assertEqual(block_groups.get_position('501002'), 1)
+        self.assertEqual(block_groups.get_location('501001'), (0.4, 0.6))
+        self.assertEqual(block_groups.get_location('501002'), (0.5, 1.5))
+        self.assertEqual(block_groups.locate(0.5, 1.2), '501002')
+        self.assertIsNone(block_groups.locate(0.5, 2.5))
+        self.assertEqual(block_groups.nearest(0.5, 2.5), '501002')
+
+        # GEOIDs match the block groups of the reference data, in their order
+        self.assertEqual(len(constants.BLOCK_GROUPS), len(constants.POPULATION))
+        geoid = constants.BLOCK_GROUPS.geoids[10]
+        self.assertEqual(constants.BLOCK_GROUPS.get_position(geoid), 10)
+
+        # sites are placed at the GEOID posted
+        user = CustomUser.objects.create_user('dummy_user@email.com', 'dummy_password')
+        bundle = ModifiedSitesBundle.objects.create(user=user, nickname='dummy_bundle')
+        self.client.force_login(user)
+        form_data = {'site_name': 'new_site', 'acres': 10, 'trails': 1, 'trail_miles': 1}
+        url = reverse('site-create', kwargs={'pk': bundle.id})
+
+        self.assertEqual(self.client.post(url, {**form_data, 'geo_id': geoid}).status_code, 302)
+        site = ModifiedSite.objects.get(bundle=bundle)
+        self.assertEqual((site.latitude, site.longitude), constants.BLOCK_GROUPS.get_location(geoid))
+        self.assertEqual(self.client.post(url, {**form_data, 'geo_id': 'unknown'}).status_code, 400)
+
+    def test_block_group_geojson(self):
+        # a block group shaped as a circle of 1000 points
+        geoid = constants.BLOCK_GROUPS.geoids[0]
+        angles = np.linspace(0, 2 * np.pi, 1000)
+        circle = np.column_stack([-78.6 + 0.05 * np.cos(angles), 35.8 + 0.05 * np.sin(angles)])
+        circle[-1] = circle[0]
+        geojson = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {'GEOID': geoid, 'NAME': 'dummy'}, 'geometry': {'type': 'Polygon', 'coordinates': [circle.tolist()]}},
+            {'type': 'Feature', 'properties': {'GEOID': '999999'}, 'geometry': {'type': 'Point', 'coordinates': [1, 1]}},
+        ]}
+
+        with tempfile.TemporaryDirectory() as directory:
+            source_path = Path(directory) / 'wake_bg.json'
+            source_path.write_text(json.dumps(geojson))
+            geometries = load_geometries(source_path, Path(directory), constants.BLOCK_GROUPS)
+
+        # coarser resolutions take a fraction of the bytes, keeping the block groups of the model only
+        self.assertLess(len(geometries['low'].content) * 10, len(geometries['full'].content))
+        features = json.loads(geometries['low'].content)['features']
+        self.assertEqual([feature['properties'] for feature in features], [{'GEOID': geoid}])
+        self.assertEqual(geo.get_resolution(8), 'low')
+        self.assertEqual(geo.get_resolution(14), 'full')
+
+        with constants.REGISTRY.override(BLOCK_GROUP_GEOJSON=geometries):
+            url = get_block_group_geojson_url(8)
+            self.assertIn(geometries['low'].version, url)
+
+            # figures only refer to the shapes by url
+            fig = create_spatial_equity_fig(pd.DataFrame({'GEOID': [geoid], 'black_utility': [1.0]}))
+            self.assertEqual(fig['data'][0]['geojson'], url)
+
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(gzip.decompress(response.content), geometries['low'].content)
+
+            old_url = reverse('block-group-geojson', kwargs={'resolution': 'low', 'version': 'old'})
+            self.assertRedirects(self.client.get(old_url), url, fetch_redirect_response=False)
+
+
+class FigureTestCase(TestCase):
+    def test_figures_match_plotly_express(self):
+        for name, arguments in benchmark.get_figure_arguments().items():
+            with self.subTest(name):
+                figure = json.loads(json.dumps(getattr(dashapp_helpers, name)(*arguments), cls=PlotlyJSONEncoder))
+                px_figure = json.loads(json.dumps(getattr(px_figures, name)(*arguments), cls=PlotlyJSONEncoder))
+                self.assertEqual(figure, px_figure)
+
+        self.assertEqual(
+            json.loads(json.dumps(dashapp_helpers.create_site_map_fig(None), cls=PlotlyJSONEncoder)),
+            json.loads(json.dumps(px_figures.create_site_map_fig(None), cls=PlotlyJSONEncoder)),
+        )
+
+
+class GoldenOutputTestCase(TestCase):
+    def test_engines_match_golden_outputs(self):
+        block_groups, golden_outputs = golden.load()
+
+        # golden outputs come from the reference model (pandas_model.py), and every one of them is finite
+        for scenario, outputs in golden_outputs.items():
+            for name, values in outputs.items():
+                if name != 'site_names':
+                    self.assertTrue(np.isfinite(values).all(), f'{scenario}: {name}')
+
+        for engine in golden.ENGINES:
+            with self.subTest(engine=engine), transaction.atomic():
+                report = golden.compare(golden.evaluate_scenarios(engine), golden_outputs, block_groups)
+                self.assertEqual(report, [], '\n'.join(report))
+                transaction.set_rollback(True)
+
+
+class DatabaseTestCase(TestCase):
+    def test_baseline_constraints(self):
+        user = CustomUser.objects.create_user('baseline@email.com', 'baseline')
+        baseline_model = BaselineModel.objects.create(user=user, name='baseline')
+        BaselineSite.objects.create(baseline_model=baseline_model, name='site', visits=1)
+
+        # a user has one baseline, with one calibration visit per site
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BaselineModel.objects.create(user=user, name='another baseline')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BaselineSite.objects.create(baseline_model=baseline_model, name='site', visits=2)
+
+    def test_recalibration(self):
+        user = CustomUser.objects.create_user('recalibration@email.com', 'recalibration')
+        self.client.force_login(user)
+        sites = constants.BASELINE_VISITS['visits']
+
+        # the whole form is written in a few bulk queries, however many sites there are
+        form = {f'{name} (site)': visits for name, visits in sites.items()}
+        form[f'{sites.index[0]} (site)'] = 10
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('recalibrate-baseline'), {'baselineModelName': 'recalibrated', **form})
+        self.assertLess(len(queries), 15)
+
+        baseline_model = BaselineModel.objects.get(user=user)
+        self.assertEqual(BaselineSite.objects.filter(baseline_model=baseline_model).count(), len(sites))
+        self.assertEqual(BaselineSite.objects.get(baseline_model=baseline_model, name=sites.index[0]).visits, 10)
+
+        # an uploaded file updates the sites it lists
+        visits_file = SimpleUploadedFile('visits.csv', f'name,visits\n"{sites.index[1]}",20\n'.encode())
+        self.client.post(reverse('edit-baseline', kwargs={'baseline_id': baseline_model.id}), {'baselineModelName': 'uploaded', 'visitsFile': visits_file})
+        self.assertEqual(BaselineSite.objects.get(baseline_model=baseline_model, name=sites.index[1]).visits, 20)
+        self.assertEqual(BaselineSite.objects.get(baseline_model=baseline_model, name=sites.index[0]).visits, 10)
+
+        # nothing is saved when any site is unknown or has invalid visits
+        response = self.client.post(
+            reverse('edit-baseline', kwargs={'baseline_id': baseline_model.id}),
+            {'baselineModelName': 'invalid', f'{sites.index[0]} (site)': 30, 'unknown site (site)': 5, f'{sites.index[1]} (site)': '-1'},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.context['errors']), 2)
+        self.assertEqual(BaselineSite.objects.get(baseline_model=baseline_model, name=sites.index[0]).visits, 10)
+
+    def test_database_report_needs_postgresql(self):
+        with self.assertRaisesMessage(CommandError, 'need PostgreSQL'):
+            call_command('database_report')
+
+
+class BenchmarkTestCase(TestCase):
+    def test_compare(self):
+        def result(stage, seconds, peak_bytes):
+            return {'custom_sites': 10, 'block_groups': 596, 'stage': stage, 'seconds': seconds, 'peak_bytes': peak_bytes}
+
+        baseline_results = [result('site_visits', 0.010, 1024 * 1024), result('bundle_list', 0.200, 1024 * 1024)]
+        results = [result('site_visits', 0.011, 1024 * 1024), result('bundle_list', 0.300, 4 * 1024 * 1024)]
+
+        # only the stage that grew past the threshold, in time and memory
+        regressions = benchmark.compare(results, baseline_results, threshold=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(regression.startswith('bundle_list') for regression in regressions))
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+
+from django.conf import settings
+
+
+# timings of the request being handled (set by ServerTimingMiddleware), None outside of a request
+_current_timings = ContextVar('choice_model_timings', default=None)
+
+
+class RequestTimings():
+    """
+    total duration and number of runs of each stage timed while handling a request
+
+    stages run concurrently (see choice_model/concurrency.py) add up, so they can take longer than the request
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.durations[name] += seconds
+            self.counts[name] += 1
+
+    def get_server_timing(self):
+        """
+        return value of the Server-Timing header, with durations in milliseconds
+        """
+        return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.durations.items())
+
+    def get_log_fields(self):
+        return ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in self.durations.items())
+
+
+@contextmanager
+def request_timings():
+    """
+    collect the stages timed within the with block into a new RequestTimings
+    """
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    time the with block (or the decorated function) as a stage of the current request
+
+    stages can be nested (a stage then includes the ones inside it) and repeated (durations add up).
+    outside of a request nothing is timed, which costs one lookup of a context variable
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    database execute wrapper timing every query as the db stage, installed on every connection (see signals.py)
+    """
+    with stage('db'):
+        return execute(sql, params, many, context)
+
+
+class StageStatistics():
+    """
+    the last CHOICE_MODEL_TIMING_SAMPLES durations of each stage over all requests handled by the process
+    """
+
+    def __init__(self, samples):
+        self.samples = samples
+        self._durations = defaultdict(lambda: deque(maxlen=samples))
+        self._lock = threading.Lock()
+
+    def add(self, timings):
+        if not self.samples:
+            return
+
+        with self._lock:
+            for name, seconds in timings.durations.items():
+                self._durations[name].append(seconds)
+
+    def summarize(self):
+        """
+        return dictionary with stage names as keys and their number of samples, p50 and p95 (in milliseconds) as values
+        """
+        with self._lock:
+            durations = {name: np.array(samples) for name, samples in self._durations.items()}
+
+        return {
+            name: {
+                'samples': len(samples),
+                'p50_ms': float(np.percentile(samples, 50) * 1000),
+                'p95_ms': float(np.percentile(samples, 95) * 1000),
+            }
+            for name, samples in durations.items()
+        }
+
+
+STATISTICS = StageStatistics(settings.CHOICE_MODEL_TIMING_SAMPLES)
@@ -4,6 +4,9 @@ from .views import *
 urlpatterns = [
     path('models/', BundleList, name='bundles'),
     path('models/<uuid:bundle_id>/', BundleList, name='bundles'),
+    path('models/status/', BundleStatus, name='bundle-status'),
+    path('models/<uuid:bundle_id>/status/', BundleStatus, name='bundle-status'),
+    path('models/compare/', BundleComparison, name='bundle-compare'),
     path('model/', BundleCreate.as_view(), name='bundle-create'),
     path('model/<uuid:pk>/update/', BundleUpdate, name='bundle-update'),
     path('model/<uuid:pk>/delete/', BundleDelete.as_view(), name='bundle-delete'),
@@ -16,4 +19,8 @@ urlpatterns = [
     path('recalibrate/', RecalibrateBaseline, name='recalibrate-baseline'),
     path('baseline/edit/<uuid:baseline_id>/', EditBaseline, name='edit-baseline'),
     path('baseline/delete/<uuid:baseline_id>/', DeleteBaseline, name='delete-baseline'),
+
+    path('geo/block-groups.<str:resolution>.<str:version>.json', BlockGroupGeoJSON, name='block-group-geojson'),
+
+    path('timing/', StageTimings, name='stage-timings'),
 ]
\ No newline at end of file
@@ -1,3 +1,5 @@
 from .bundle import *
 from .calibration import *
-from .site import *
\ No newline at end of file
+from .geo import *
+from .site import *
+from .timing import *
\ No newline at end of file
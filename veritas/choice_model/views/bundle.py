@@ -1,5 +1,10 @@
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect, render
-import plotly.express as px
+import functools
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -8,65 +13,160 @@ from django.urls import reverse_lazy
 from itertools import chain
 
 from choice_model.choicemodel import ChoiceModel 
+from choice_model.concurrency import run_concurrently, run_in_thread
 from choice_model.dashapps import site_choice_prob
 from choice_model.dashapp_helpers import *
+from choice_model.dashboard import DEFAULT_FIGURE, get_figure
+from choice_model.decorators import async_login_required
+from choice_model.jobs import STALE, get_scenario, get_scenario_hashes, get_scenario_status
 from choice_model.models import *
+from choice_model.queries import ScenarioData
+from choice_model.timing import stage
 
 
-@login_required
-def BundleList(request, bundle_id=None):
+def _get_dash_context(baseline, counterfactual):
+    """
+    return initial arguments of the dashboard, with the figure of its default tab comparing the counterfactual with
+    the baseline (the other tabs are built by the dash app once they are selected, see dashapps/site_choice_prob.py)
+    """
+    # evaluate baseline & counterfactual at the same time, or only once when the counterfactual is the baseline
+    if counterfactual is baseline:
+        baseline.summary
+    else:
+        run_concurrently(lambda: baseline.summary, lambda: counterfactual.summary)
+
+    return {
+        DEFAULT_FIGURE: {'figure': get_figure(DEFAULT_FIGURE, baseline, counterfactual)},
+        'bundle-id': {'data': None if counterfactual.bundle is None else str(counterfactual.bundle.id)},
+    }
+
+
+def _get_bundle(bundles, bundle_id):
+    for bundle in bundles:
+        if bundle.id == bundle_id:
+            return bundle
+
+    raise Http404('No bundle matches the given query.')
+
+
+@async_login_required
+async def BundleList(request, bundle_id=None):
     if request.method == 'GET':
 
         # load all bundles belonging to user
-        bundles = ModifiedSitesBundle.objects.filter(user=request.user)
+        bundles = [bundle async for bundle in ModifiedSitesBundle.objects.filter(user=request.user)]
 
         # define bundle in focus
-        bundle = None if bundle_id is None else bundles.get(id=bundle_id)
-            
-        # calculate the baseline & counterfactual (if bundle == None then counterfactual will be baseline)
-        baseline = ChoiceModel(request.user, bundle=None)
-        counterfactual = ChoiceModel(request.user, bundle=bundle)
-
-        # calculate site visits for both baseline and counterfactual, then combine into one dataframe
-        baseline_visits = baseline.get_site_visits()
-        counterfactual_visits = counterfactual.get_site_visits()
-        baseline_visits['type'] = 'baseline'
-        counterfactual_visits['type'] = 'counterfactual'
-        combined_visits = pd.concat([baseline_visits, counterfactual_visits])
-
-        # calculate equity evaluation for counterfactual
-        equity_evaluation = counterfactual.get_equity_evaluation()
-        equity_black, equity_other = equity_evaluation['average_utility_black'], equity_evaluation['average_utility_other']
-
-        # get equity of each block group for baseline & counterfactual and then store the difference
-        counterfactual_bg_utility_black = counterfactual.get_utility_by_block_group()[0].sum().to_frame()
-        baseline_bg_utility_black = baseline.get_utility_by_block_group()[0].sum().to_frame()
-        diff_bg_utility_black = counterfactual_bg_utility_black - baseline_bg_utility_black
-        diff_bg_utility_black['GEOID'] = diff_bg_utility_black.index.str.replace(', ', '').str[:6]
-        diff_bg_utility_black = diff_bg_utility_black.rename(columns={0: 'black_utility'})
-
-        # create the plotly figures
-        bubble_fig = create_bubble_plot_fig(combined_visits)
-        map_scatter_fig = create_map_scatter_plot_fig(counterfactual_visits, counterfactual.get_site_locations())
-        equity_evaluation_fig = create_equity_evaluation_fig(equity_black, equity_other)
-        spatial_equity_fig = create_spatial_equity_fig(diff_bg_utility_black)
-
-        # custom_baseline is None if no BaselineModel objects can be found, otherwise set as what is found
-        custom_baseline = None if not BaselineModel.objects.filter(user=request.user).exists() else BaselineModel.objects.get(user=request.user)
+        bundle = None if bundle_id is None else _get_bundle(bundles, bundle_id)
+
+        # load the baseline & counterfactual (if bundle == None then counterfactual is the baseline) from the same rows
+        data = await ScenarioData.aload(request.user, [bundle])
+        baseline = ChoiceModel(request.user, None, data)
+        counterfactual = baseline if bundle is None else ChoiceModel(request.user, bundle, data)
 
         context = {
             'bundles': bundles,
             'bundle': bundle,
-            'custom_baseline': custom_baseline,
-            'dash_context': {
-                'bubble-plot': {'figure': bubble_fig},
-                'map-scatter-plot': {'figure': map_scatter_fig},
-                'equity-evaluation-plot': {'figure': equity_evaluation_fig},
-                'spatial-equity-plot': {'figure': spatial_equity_fig},
-            },
+            # custom_baseline is None if the user has not recalibrated the baseline
+            'custom_baseline': baseline.baseline_model,
+            'status': ScenarioJob.DONE,
         }
 
-        return render(request, 'choice_model/bundles.html', context)
+        # with background jobs, results are taken from the jobs and the page polls for them until they are ready
+        if settings.CHOICE_MODEL_BACKGROUND_JOBS:
+            # the counterfactual is the baseline itself when no bundle is selected, which only has one job
+            statuses = []
+            for model in dict.fromkeys([baseline, counterfactual]):
+                status, model.summary = await sync_to_async(get_scenario)(model)
+                statuses.append(status)
+
+            if any(status != ScenarioJob.DONE for status in statuses):
+                context['status'] = ScenarioJob.FAILED if ScenarioJob.FAILED in statuses else ScenarioJob.PENDING
+
+                with stage('render'):
+                    return await sync_to_async(render)(request, 'choice_model/bundles.html', context)
+
+        # the models are evaluated off the event loop, so other requests are served in the meantime
+        context['dash_context'] = await run_in_thread(_get_dash_context, baseline, counterfactual)
+
+        with stage('render'):
+            return await sync_to_async(render)(request, 'choice_model/bundles.html', context)
+
+
+@login_required
+def BundleStatus(request, bundle_id=None):
+    """
+    return status of the background jobs evaluating the baseline and a bundle, polled by BundleList until it is done
+
+    polling only reads the jobs, a scenario needing a new job is reported as stale and the page is loaded again,
+    which queues it (see get_scenario)
+    """
+    if request.method == 'GET':
+        bundle = None
+        if bundle_id is not None:
+            bundle = ModifiedSitesBundle.objects.filter(user=request.user, id=bundle_id).first()
+            if bundle is None:
+                return JsonResponse({'error': 'bundle not found'}, status=404)
+
+        scenarios = [None] if bundle is None else [None, bundle]
+
+        # rows of the scenarios are only loaded (once) to tell whether a finished job is up to date
+        @functools.cache
+        def load_data():
+            return ScenarioData.load(request.user, scenarios)
+
+        def get_hashes(scenario):
+            return lambda: get_scenario_hashes(ChoiceModel(request.user, scenario, load_data()))
+
+        statuses = [get_scenario_status(request.user, scenario, get_hashes(scenario)) for scenario in scenarios]
+
+        if ScenarioJob.FAILED in statuses:
+            status = ScenarioJob.FAILED
+        elif STALE in statuses:
+            status = STALE
+        elif all(status == ScenarioJob.DONE for status in statuses):
+            status = ScenarioJob.DONE
+        else:
+            status = ScenarioJob.PENDING
+
+        return JsonResponse({'status': status})
+
+
+@login_required
+def BundleComparison(request):
+    """
+    return table comparing the baseline with the bundles of the user (all of them, or only those given as ?bundle=<id>)
+    """
+    if request.method == 'GET':
+        bundles = ModifiedSitesBundle.objects.filter(user=request.user).order_by('nickname')
+
+        bundle_ids = request.GET.getlist('bundle')
+        if bundle_ids:
+            try:
+                bundle_ids = [uuid.UUID(bundle_id) for bundle_id in bundle_ids]
+            except ValueError:
+                return JsonResponse({'error': 'bundle must be a bundle id'}, status=400)
+            bundles = bundles.filter(id__in=bundle_ids)
+
+        # evaluate the baseline and every bundle together
+        bundles = [None] + list(bundles)
+        summaries = ChoiceModel.evaluate_many(request.user, bundles)
+        baseline = summaries[0]
+
+        scenarios = []
+        for bundle, summary in zip(bundles, summaries):
+            scenarios.append({
+                'id': None if bundle is None else str(bundle.id),
+                'nickname': 'Baseline' if bundle is None else bundle.nickname,
+                'visits': float(summary.visits.sum()),
+                'visits_change': float(summary.visits.sum() - baseline.visits.sum()),
+                'average_utility_black': float(summary.equity_evaluation['average_utility_black']),
+                'average_utility_other': float(summary.equity_evaluation['average_utility_other']),
+                'black_utility_change': float((summary.block_group_utility_black - baseline.block_group_utility_black).sum()),
+                'other_utility_change': float((summary.block_group_utility_other - baseline.block_group_utility_other).sum()),
+            })
+
+        return JsonResponse({'scenarios': scenarios})
 
 
 class BundleCreate(LoginRequiredMixin, CreateView):
@@ -80,59 +180,55 @@ class BundleCreate(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-@login_required
-def BundleUpdate(request, **kwargs):
+def _get_site_map_fig(selected_site):
+    with stage('figures'):
+        return create_site_map_fig(selected_site)
+
+
+@async_login_required
+async def BundleUpdate(request, **kwargs):
     if request.method == 'GET':
         context = {
-            'bundle': ModifiedSitesBundle.objects.get(user=request.user, id=kwargs['pk']),
+            'bundle': await ModifiedSitesBundle.objects.aget(user=request.user, id=kwargs['pk']),
             'modified': False,
         }
+        modified_sites = [site async for site in ModifiedSite.objects.filter(bundle=kwargs['pk']).order_by('name')]
 
         # check for filter for only modified/new sites
         if request.GET.get('modified-only') is not None:
             context['modified'] = True
-            context['sites'] = ModifiedSite.objects.filter(bundle=kwargs['pk']).order_by('name')
+            context['sites'] = modified_sites
         else:
             # prevent original sites from showing up if already in modified sites
-            modified_sites = ModifiedSite.objects.all().filter(bundle=kwargs['pk'])
             modified_sites_names = [site.name for site in modified_sites]
-            original_sites = Site.objects.all().exclude(name__in=modified_sites_names)
-            context['sites'] = sorted(list(chain(original_sites, modified_sites)), key=lambda site: site.name)
+            original_sites = [site async for site in Site.objects.exclude(name__in=modified_sites_names)]
+            context['sites'] = sorted(chain(original_sites, modified_sites), key=lambda site: site.name)
 
         # check if site is being selected to show on map/characteristics
         if request.GET.get('show-site') is not None:
             selected_site_name = request.GET.get('show-site')
-            
-            if ModifiedSite.objects.filter(bundle=kwargs['pk'], name=selected_site_name).exists():
-                selected_site = ModifiedSite.objects.all().get(bundle=kwargs['pk'], name=selected_site_name)
-            else:
-                selected_site = Site.objects.get(name=selected_site_name)
+
+            # modified sites take the place of the original sites of the same name in the list, which usually has the selected site
+            selected_site = next((site for site in context['sites'] if site.name == selected_site_name), None)
+            if selected_site is None:
+                selected_site = await Site.objects.aget(name=selected_site_name)
 
             # pass selected site into context
             context['selected_site'] = selected_site
-            map_scatter_fig = px.scatter_mapbox(
-                {'name': {0: selected_site.name}, 'latitude': {0: selected_site.latitude}, 'longitude': {0: selected_site.longitude}, 'empty': {0: 0}},
-                lat='latitude', 
-                lon='longitude', 
-                zoom=14,
-                hover_name='name',
-                mapbox_style='open-street-map'
-            )
-            map_scatter_fig.update_layout(margin={'l':0, 'r': 0, 't':0, 'b':0})
         else:
-            map_scatter_fig = px.scatter_mapbox(center={'lat': 100, 'lon': 100})
             context['selected_site'] = None
 
         # include name of sites that have already been modified
-        context['modified_site_names'] = ModifiedSite.objects.filter(bundle=kwargs['pk']).values_list('name', flat=True)
-        context['dash_context'] = {'map-plot': {'figure': map_scatter_fig}}
+        context['modified_site_names'] = [site.name for site in modified_sites]
+        context['dash_context'] = {'map-plot': {'figure': await run_in_thread(_get_site_map_fig, context['selected_site'])}}
 
-        return render(request, 'choice_model/bundle_modify.html', context)
+        with stage('render'):
+            return await sync_to_async(render)(request, 'choice_model/bundle_modify.html', context)
 
     elif request.method == 'POST':
-        bundle = ModifiedSitesBundle.objects.get(id=kwargs['pk'], user=request.user)
+        bundle = await ModifiedSitesBundle.objects.aget(id=kwargs['pk'], user=request.user)
         bundle.nickname = request.POST['siteName']
-        bundle.save()
+        await sync_to_async(bundle.save)()
 
         return redirect('bundle-update', pk=bundle.id)
 
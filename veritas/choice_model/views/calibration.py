@@ -1,31 +1,38 @@
+from django.core.exceptions import ValidationError
 from django.shortcuts import redirect, render
 
 from choice_model.models import BaselineModel, BaselineSite
+from choice_model.baseline import get_form_visits, read_visits_file, save_baseline, validate_visits
+from choice_model.cache import invalidate_baseline_summary
 from choice_model.choicemodel import ChoiceModel
-from choice_model.constants import BASELINE_VISITS
+from choice_model import constants
+
+
+def _get_posted_visits(request):
+    """
+    return validated visits of a calibration form, taken from the uploaded file (visitsFile) when there is one
+    """
+    visits_file = request.FILES.get('visitsFile')
+    if visits_file is not None:
+        return validate_visits(read_visits_file(visits_file))
+
+    return validate_visits(get_form_visits(request.POST))
 
 
 def RecalibrateBaseline(request):
     if request.method == 'GET':
-        return render(request, 'choice_model/calibration.html', {'baseline_site_visits': BASELINE_VISITS.to_dict()['visits']})
+        return render(request, 'choice_model/calibration.html', {'baseline_site_visits': constants.BASELINE_VISITS.to_dict()['visits']})
 
     elif request.method == 'POST':
-        # create baseline calibration model
-        baseline_model = BaselineModel.objects.create(
-            user=request.user,
-            name=request.POST['baselineModelName'],
-        )
-
-        # add site data to the baseline model
-        for key, value in request.POST.items():
-            if '(site)' in key:
-                site_name = key.replace(' (site)', '')
-                site_visits = value
-                BaselineSite.objects.create(
-                    baseline_model=baseline_model,
-                    name=site_name,
-                    visits=site_visits,
-                )
+        # create baseline calibration model along with its site data
+        try:
+            save_baseline(request.user, request.POST['baselineModelName'], _get_posted_visits(request))
+        except ValidationError as error:
+            context = {
+                'baseline_site_visits': {**constants.BASELINE_VISITS.to_dict()['visits'], **get_form_visits(request.POST)},
+                'errors': error.messages,
+            }
+            return render(request, 'choice_model/calibration.html', context, status=400)
 
         return redirect('bundles')
 
@@ -38,19 +45,19 @@ def EditBaseline(request, **kwargs):
         return render(request, 'choice_model/edit_baseline.html', {'baseline': baseline, 'baseline_sites': baseline_sites})
 
     elif request.method == 'POST':
-        # fetch baseline model and also update name
-        baseline_model = BaselineModel.objects.get(user=request.user, id=kwargs['baseline_id'])
-        baseline_model.name = request.POST['baselineModelName']
-        baseline_model.save()
-
-        # update site data for baseline model
-        for key, value in request.POST.items():
-            if '(site)' in key:
-                site_name = key.replace(' (site)', '')
-                site_visits = value
-                baseline_site = BaselineSite.objects.get(baseline_model=baseline_model, name=site_name)
-                baseline_site.visits = site_visits
-                baseline_site.save()
+        # fetch baseline model, then update its name and site data
+        baseline = BaselineModel.objects.get(user=request.user, id=kwargs['baseline_id'])
+        try:
+            save_baseline(request.user, request.POST['baselineModelName'], _get_posted_visits(request))
+        except ValidationError as error:
+            # show the visits as they were entered
+            baseline_sites = list(BaselineSite.objects.filter(baseline_model=baseline))
+            form_visits = get_form_visits(request.POST)
+            for baseline_site in baseline_sites:
+                baseline_site.visits = form_visits.get(baseline_site.name, baseline_site.visits)
+
+            context = {'baseline': baseline, 'baseline_sites': baseline_sites, 'errors': error.messages}
+            return render(request, 'choice_model/edit_baseline.html', context, status=400)
 
         return redirect('bundles')
 
@@ -61,4 +68,6 @@ def DeleteBaseline(request, **kwargs):
         baseline = BaselineModel.objects.get(user=request.user, id=kwargs['baseline_id'])
         baseline.delete()
 
+        invalidate_baseline_summary(request.user.pk)
+
         return redirect('bundles')
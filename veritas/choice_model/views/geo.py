@@ -0,0 +1,31 @@
+from django.shortcuts import redirect
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from choice_model import constants
+
+
+def BlockGroupGeoJSON(request, resolution, version):
+    """
+    return geojson of the block groups at resolution (see geo.RESOLUTIONS), cached by browsers for good since a new
+    version gets a new url
+    """
+    if resolution not in constants.BLOCK_GROUP_GEOJSON:
+        raise Http404('No resolution matches the given query.')
+    asset = constants.BLOCK_GROUP_GEOJSON[resolution]
+
+    # pages rendered before the geojson changed still get the shapes, from the url of the current version
+    if version != asset.version:
+        return redirect('block-group-geojson', resolution=resolution, version=asset.version)
+
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = HttpResponse(asset.compressed, content_type='application/geo+json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(asset.content, content_type='application/geo+json')
+
+    response['ETag'] = f'"{asset.version}"'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+
+    return response
@@ -1,58 +1,95 @@
 import json
 
-from django.contrib.auth.decorators import login_required
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import HttpResponseBadRequest
 from django.middleware.csrf import get_token
 from django.shortcuts import redirect, render
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.urls import reverse, reverse_lazy
 
 from choice_model.choicemodel import ChoiceModel
-from choice_model.constants import *
+from choice_model import constants
 from choice_model.dashapps import add_site, site_choice_prob, site_selection
+from choice_model.concurrency import run_in_thread
 from choice_model.dashapp_helpers import *
+from choice_model.decorators import async_login_required
 from choice_model.models import *
+from choice_model.timing import stage
 
 from pathlib import Path
 
 
-@login_required
-def SiteCreate(request, **kwargs):
+def _get_block_group_utility_fig(choice_model):
+    """
+    return choropleth of the utility of each block group for black residents
+    """
+    # calculate sum of equity for each block
+    bg_utility_black = choice_model.get_block_group_utility()[['black_utility']]
+
+    # convert to format that can be read by choropleth mapbox
+    bg_utility_black['GEOID'] = constants.BLOCK_GROUPS.geoids
+
+    with stage('figures'):
+        return create_spatial_equity_fig(bg_utility_black)
+
+
+def _get_site_location(form_data):
+    """
+    return (lat, lon) of a new site from the GEOID or the latitude & longitude posted, ValueError if they are invalid
+    """
+    block_groups = constants.BLOCK_GROUPS
+
+    geoid = form_data.get('geo_id', '').strip()
+    if geoid:
+        if geoid not in block_groups:
+            raise ValueError(f'{geoid} is not the GEOID of a block group')
+        return block_groups.get_location(geoid)
+
+    try:
+        lat, lon = float(form_data['latitude']), float(form_data['longitude'])
+    except (KeyError, ValueError):
+        raise ValueError('either a GEOID or a latitude & longitude is required')
+
+    if block_groups.locate(lat, lon) is None:
+        raise ValueError(f'({lat}, {lon}) is not within a block group')
+
+    return lat, lon
+
+
+@async_login_required
+async def SiteCreate(request, **kwargs):
     if request.method == 'GET':
-        # calculate sum of equity for each block
-        choice_model = ChoiceModel(user=request.user)
-        bg_utility_black = choice_model.get_utility_by_block_group()[0].sum().to_frame()
-
-        # convert to format that can be read by choropleth mapbox
-        bg_utility_black['GEOID'] = bg_utility_black.index.str.replace(', ', '').str[:6]
-        bg_utility_black = bg_utility_black.rename(columns={0: 'black_utility'})
-        
+        choice_model = await ChoiceModel.aload(user=request.user)
+        spatial_equity_fig = await run_in_thread(_get_block_group_utility_fig, choice_model)
+
         bundle_id = str(kwargs['pk'])
         context = {
             'bundle_id': bundle_id,
             'dash_context': {
-                'add-site-plot': {'figure': create_spatial_equity_fig(bg_utility_black)},
+                'add-site-plot': {'figure': spatial_equity_fig},
                 'bundle_id': {'value': bundle_id},
                 'csrfmiddlewaretoken': {'value': get_token(request)}
             }
         }
 
-        return render(request, 'choice_model/site_create.html', context)
+        with stage('render'):
+            return await sync_to_async(render)(request, 'choice_model/site_create.html', context)
     
     elif request.method == 'POST':
         form_data = request.POST
         bundle_id = str(kwargs['pk'])
 
-        # get the appropriate lat & lon for the respective GEOID
-        geoid = form_data['geo_id']
-        for feature in WAKE_BG_GEOJSON['features']:
-            if geoid == feature['properties']['GEOID']:
-                lat = float(feature['properties']['INTPTLAT'])
-                lon = float(feature['properties']['INTPTLON'])
-                break
+        # place the site at the given GEOID (at its interior point), or at the given lat & lon within a block group
+        try:
+            lat, lon = _get_site_location(form_data)
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
 
-        ModifiedSite.objects.create(
-            bundle=ModifiedSitesBundle.objects.get(id=bundle_id),
+        await ModifiedSite.objects.acreate(
+            bundle=await ModifiedSitesBundle.objects.aget(id=bundle_id),
             latitude=lat,
             longitude=lon,
             name=form_data['site_name'],
@@ -83,9 +120,13 @@ class ModifiedSiteCreate(LoginRequiredMixin, CreateView):
 
         return context
 
+    @cached_property
+    def site(self):
+        return Site.objects.get(name=self.kwargs['site_name'])
+
     def get_initial(self):
         initial =  super().get_initial()
-        site = Site.objects.get(name=self.kwargs['site_name'])
+        site = self.site
 
         initial = {
             'name': site.name,
@@ -110,7 +151,7 @@ class ModifiedSiteCreate(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         bundle_id = str(self.kwargs['pk'])
-        site = Site.objects.get(name=self.kwargs['site_name'])
+        site = self.site
 
         form.instance.bundle = ModifiedSitesBundle.objects.get(id=bundle_id)
         form.instance.latitude = site.latitude
@@ -0,0 +1,12 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from choice_model.timing import STATISTICS
+
+
+@staff_member_required
+def StageTimings(request):
+    """
+    return p50 & p95 duration of each stage over the recent requests handled by this process
+    """
+    return JsonResponse({'samples': STATISTICS.samples, 'stages': STATISTICS.summarize()})
@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'veritas.settings')
 
 application = get_asgi_application()
+
+# load the choice model reference data while the worker starts rather than during its first request
+from django.conf import settings
+
+if settings.CHOICE_MODEL_WARM_UP:
+    from choice_model import constants
+    constants.warm_up()
@@ -78,12 +78,15 @@ X_FRAME_OPTIONS = 'SAMEORIGIN'
 MIDDLEWARE = [
       'django.middleware.security.SecurityMiddleware',
 
+      'choice_model.middleware.ServerTimingMiddleware',
+
       'whitenoise.middleware.WhiteNoiseMiddleware',
 
       'django.contrib.sessions.middleware.SessionMiddleware',
       'django.middleware.common.CommonMiddleware',
       'django.middleware.csrf.CsrfViewMiddleware',
       'django.contrib.auth.middleware.AuthenticationMiddleware',
+      'choice_model.middleware.ProfilingMiddleware',
       'django.contrib.messages.middleware.MessageMiddleware',
 
       'django_plotly_dash.middleware.BaseMiddleware',
@@ -123,6 +126,57 @@ DATABASES = {}
 DATABASES['default'] = dj_database_url.config(ssl_require=True)
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # results of the choice model, kept between requests (see choice_model/cache.py)
+    'choice_model': {
+        'BACKEND': 'choice_model.cache.BoundedLocMemCache',
+        'LOCATION': 'choice-model-results',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+            'MAX_BYTES': int(os.environ.get('CHOICE_MODEL_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+        },
+    },
+}
+
+
+# load choice model reference data when a web worker starts (see veritas/wsgi.py), rather than on first use
+CHOICE_MODEL_WARM_UP = os.environ.get('CHOICE_MODEL_WARM_UP', 'true').lower() == 'true'
+
+# number of recently edited bundles whose model each process keeps to re-evaluate incrementally (see choice_model/cache.py)
+CHOICE_MODEL_INCREMENTAL_ENGINES = int(os.environ.get('CHOICE_MODEL_INCREMENTAL_ENGINES', 16))
+
+# send the duration of each stage of a request as a Server-Timing header (see choice_model/timing.py)
+CHOICE_MODEL_SERVER_TIMING = os.environ.get('CHOICE_MODEL_SERVER_TIMING', 'true').lower() == 'true'
+
+# number of recent durations of each stage each process keeps for the statistics at /timing/, 0 to keep none
+CHOICE_MODEL_TIMING_SAMPLES = int(os.environ.get('CHOICE_MODEL_TIMING_SAMPLES', 1000))
+
+# profiles of requests made by staff with ?profile=1 (see choice_model/profiling.py), only the most recent ones are kept
+CHOICE_MODEL_PROFILE_DIR = os.environ.get('CHOICE_MODEL_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+CHOICE_MODEL_PROFILES = int(os.environ.get('CHOICE_MODEL_PROFILES', 50))
+CHOICE_MODEL_PROFILE_LINES = int(os.environ.get('CHOICE_MODEL_PROFILE_LINES', 40))
+
+# evaluate scenarios in background jobs the dashboard polls for (see choice_model/jobs.py), rather than within requests
+CHOICE_MODEL_BACKGROUND_JOBS = os.environ.get('CHOICE_MODEL_BACKGROUND_JOBS', 'true').lower() == 'true'
+# threads of each web process running jobs, 0 to leave them to a worker (manage.py run_scenario_jobs)
+CHOICE_MODEL_JOB_THREADS = int(os.environ.get('CHOICE_MODEL_JOB_THREADS', 2))
+# seconds after which a running job is taken as lost (e.g. its process was restarted) and queued again
+CHOICE_MODEL_JOB_TIMEOUT = int(os.environ.get('CHOICE_MODEL_JOB_TIMEOUT', 300))
+# seconds after which the scenario of a failed job is queued again the next time it is viewed
+CHOICE_MODEL_JOB_RETRY_DELAY = int(os.environ.get('CHOICE_MODEL_JOB_RETRY_DELAY', 60))
+
+# threads of each process evaluating the baseline and counterfactual (and building their figures) of a request concurrently
+# (see choice_model/concurrency.py), best set to the cores of the dyno, below 2 to evaluate them one after another
+CHOICE_MODEL_REQUEST_THREADS = int(os.environ.get('CHOICE_MODEL_REQUEST_THREADS', min(os.cpu_count() or 1, 4)))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
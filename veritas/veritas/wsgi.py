@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'veritas.settings')
 
 application = get_wsgi_application()
+
+# load the choice model reference data while the worker starts rather than during its first request
+from django.conf import settings
+
+if settings.CHOICE_MODEL_WARM_UP:
+    from choice_model import constants
+    constants.warm_up()